@@ -0,0 +1,12 @@
+"""Benchmarks of the Python layer around libiperf, run with asv
+
+Run against the current checkout and compare two releases::
+
+    $ asv run
+    $ asv continuous v0.1.11 HEAD
+
+Results are stored per machine and commit in ``.asv/results``, so
+regressions show up with ``asv compare`` between releases. Benchmarks
+needing libiperf or the iperf3 command line are skipped where those are
+not installed.
+"""
@@ -0,0 +1,52 @@
+import os
+
+from iperf.iperf3._iperf3 import PipeReader, read_pipe
+
+from .common import result_text
+
+
+class TimeCapture:
+    """Draining libiperf's json output, sized by the number of intervals"""
+
+    params = [1000, 10000, 50000]
+    param_names = ["intervals"]
+
+    def setup_cache(self):
+        # Written to asv's cache directory, which is removed after the run
+        paths = {}
+        for num_intervals in self.params:
+            path = os.path.abspath("intervals-{}.json".format(num_intervals))
+            with open(path, "w") as f:
+                f.write(result_text(num_intervals))
+            paths[num_intervals] = path
+        return paths
+
+    def setup(self, paths, num_intervals):
+        with open(paths[num_intervals], "rb") as f:
+            self.data = f.read()
+
+    def time_read_pipe(self, paths, num_intervals):
+        fd = os.open(paths[num_intervals], os.O_RDONLY)
+        try:
+            read_pipe(fd)
+        finally:
+            os.close(fd)
+
+    def time_pipe_reader(self, paths, num_intervals):
+        pipe_out, pipe_in = os.pipe()
+        reader = PipeReader(pipe_out)
+        reader.start()
+
+        view = memoryview(self.data)
+        while view:
+            view = view[os.write(pipe_in, view) :]
+
+        reader.stop()
+        os.close(pipe_in)
+        os.close(pipe_out)
+
+    def track_megabytes(self, paths, num_intervals):
+        """Size of the captured output, to relate the timings to"""
+        return len(self.data) / 1e6
+
+    track_megabytes.unit = "MB"
@@ -0,0 +1,59 @@
+import json
+import subprocess
+
+from iperf.iperf3 import Client
+
+from .common import free_port, require_cli, require_libiperf, start_server
+
+
+class TrackLoopback:
+    """Throughput over the loopback interface, the wrapper and the CLI
+
+    Both run against the same iperf3 command line server, so the gap
+    between the two is the cost of the Python layer.
+    """
+
+    duration = 5
+    timeout = 120
+
+    def setup(self):
+        require_libiperf()
+        require_cli()
+        self.port = free_port()
+        self.server = start_server(self.port)
+
+    def teardown(self):
+        self.server.kill()
+        self.server.wait()
+
+    def track_client_gbps(self):
+        with Client() as client:
+            client.server_hostname = "127.0.0.1"
+            client.port = self.port
+            client.duration = self.duration
+            result = client.run()
+
+        if result.error:
+            raise RuntimeError(result.error)
+        return result.received_bps / 1e9
+
+    track_client_gbps.unit = "Gbps"
+
+    def track_cli_gbps(self):
+        output = subprocess.run(
+            [
+                "iperf3",
+                "-c",
+                "127.0.0.1",
+                "-p",
+                str(self.port),
+                "-t",
+                str(self.duration),
+                "-J",
+            ],
+            stdout=subprocess.PIPE,
+            check=True,
+        ).stdout
+        return json.loads(output)["end"]["sum_received"]["bits_per_second"] / 1e9
+
+    track_cli_gbps.unit = "Gbps"
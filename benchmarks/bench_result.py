@@ -0,0 +1,56 @@
+import tracemalloc
+
+from iperf.iperf3 import CompactTestResult, TestResult
+
+from .common import result_text
+
+RESULT_CLASSES = {
+    "TestResult": TestResult,
+    "CompactTestResult": CompactTestResult,
+}
+
+
+class TimeParse:
+    """Parsing a result, including the decoding of its summary"""
+
+    params = ([10, 100, 1000, 10000], list(RESULT_CLASSES))
+    param_names = ["intervals", "result_class"]
+
+    def setup(self, num_intervals, result_class):
+        self.text = result_text(num_intervals)
+        self.result_class = RESULT_CLASSES[result_class]
+
+    def _parse(self):
+        result = self.result_class(self.text)
+        result.sent_bps
+        return result
+
+    def time_parse(self, num_intervals, result_class):
+        self._parse()
+
+    def peakmem_parse(self, num_intervals, result_class):
+        self._parse()
+
+    def track_parse_peak_bytes(self, num_intervals, result_class):
+        """Memory allocated while parsing"""
+        tracemalloc.start()
+        try:
+            self._parse()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    track_parse_peak_bytes.unit = "bytes"
+
+    def track_retained_bytes(self, num_intervals, result_class):
+        """Memory held by a parsed result"""
+        tracemalloc.start()
+        try:
+            result = self._parse()
+            retained = tracemalloc.get_traced_memory()[0]
+            del result
+            return retained
+        finally:
+            tracemalloc.stop()
+
+    track_retained_bytes.unit = "bytes"
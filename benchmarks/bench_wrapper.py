@@ -0,0 +1,99 @@
+from iperf.iperf3 import Client, Server
+from iperf.iperf3._iperf3 import load_library
+
+from .common import require_libiperf
+
+
+class TimeInit:
+    """Creating an instance: iperf_new_test, defaults, fds and capture pipe"""
+
+    # Instances are closed in teardown, keep the number bounded so the fds
+    # of a sample fit the open file limit
+    number = 50
+    repeat = 10
+    warmup_time = 0
+
+    def setup(self):
+        require_libiperf()
+        self.lib = load_library()
+        self.instances = []
+        self.tests = []
+
+    def teardown(self):
+        for instance in self.instances:
+            instance.close()
+        for test in self.tests:
+            self.lib.iperf_free_test(test)
+
+    def time_client_init(self):
+        self.instances.append(Client())
+
+    def time_server_init(self):
+        self.instances.append(Server())
+
+    def time_raw_new_test(self):
+        """libiperf alone, the baseline of the wrapper"""
+        test = self.lib.iperf_new_test()
+        self.lib.iperf_defaults(test)
+        self.tests.append(test)
+
+
+class TimeProperty:
+    """Round trip of a property through ctypes"""
+
+    params = [
+        "port",
+        "duration",
+        "blksize",
+        "num_streams",
+        "bandwidth",
+        "reverse",
+        "json_output",
+        "server_hostname",
+    ]
+    param_names = ["name"]
+
+    values = {
+        "port": 5201,
+        "duration": 10,
+        "blksize": 131072,
+        "num_streams": 4,
+        "bandwidth": 10**9,
+        "reverse": True,
+        "json_output": True,
+        "server_hostname": "127.0.0.1",
+    }
+
+    def setup(self, name):
+        require_libiperf()
+        self.client = Client()
+        self.value = self.values[name]
+        setattr(self.client, name, self.value)
+
+    def teardown(self, name):
+        self.client.close()
+
+    def time_get(self, name):
+        getattr(self.client, name)
+
+    def time_set(self, name):
+        setattr(self.client, name, self.value)
+
+
+class TimeRawCall:
+    """A libiperf getter and setter called directly, the property baseline"""
+
+    def setup(self):
+        require_libiperf()
+        self.lib = load_library()
+        self.test = self.lib.iperf_new_test()
+        self.lib.iperf_defaults(self.test)
+
+    def teardown(self):
+        self.lib.iperf_free_test(self.test)
+
+    def time_get(self):
+        self.lib.iperf_get_test_duration(self.test)
+
+    def time_set(self):
+        self.lib.iperf_set_test_duration(self.test, 10)
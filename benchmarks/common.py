@@ -0,0 +1,65 @@
+import copy
+import json
+import os
+import shutil
+import socket
+import subprocess
+import time
+
+from iperf.iperf3._iperf3 import load_library
+
+RESULTS_JSON = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "tests", "results.json"
+)
+
+
+def require_libiperf():
+    """Skip the benchmark when libiperf can't be loaded"""
+    try:
+        load_library()
+    except OSError:
+        raise NotImplementedError("libiperf is not installed")
+
+
+def require_cli():
+    """Skip the benchmark when the iperf3 command line isn't installed"""
+    if shutil.which("iperf3") is None:
+        raise NotImplementedError("iperf3 is not installed")
+
+
+def result_text(num_intervals):
+    """A client result json document with the given number of intervals
+
+    :rtype: unicode string
+    """
+    with open(RESULTS_JSON) as f:
+        data = json.load(f)
+
+    intervals = data["intervals"]
+    data["intervals"] = [
+        copy.deepcopy(intervals[i % len(intervals)]) for i in range(num_intervals)
+    ]
+    return json.dumps(data)
+
+
+def free_port():
+    """A local TCP port nothing listens on"""
+    sck = socket.socket()
+    sck.bind(("127.0.0.1", 0))
+    port = sck.getsockname()[1]
+    sck.close()
+    return port
+
+
+def start_server(port):
+    """Start an iperf3 command line server on the loopback interface
+
+    :rtype: instance of :class:`subprocess.Popen`
+    """
+    server = subprocess.Popen(
+        ["iperf3", "-s", "-B", "127.0.0.1", "-p", str(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    time.sleep(0.3)  # give the server some time to start
+    return server
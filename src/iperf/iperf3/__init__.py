@@ -1,9 +1,16 @@
+from iperf.iperf3._iperf3 import live_tests, preload
 from iperf.iperf3.client import Client
+from iperf.iperf3.pool import ClientPool, ServerPool
 from iperf.iperf3.server import Server
-from iperf.iperf3.test_result import TestResult
+from iperf.iperf3.test_result import CompactTestResult, TestResult
 
 __all__ = [
     "Client",
+    "ClientPool",
+    "CompactTestResult",
     "Server",
+    "ServerPool",
     "TestResult",
+    "live_tests",
+    "preload",
 ]
@@ -1,10 +1,51 @@
-from ctypes import util, cdll, c_char_p, c_int, c_char, c_void_p, c_uint64
+from ctypes import (
+    util,
+    cdll,
+    CDLL,
+    c_char_p,
+    c_double,
+    c_int,
+    c_char,
+    c_void_p,
+    c_uint64,
+)
+import codecs
+import json
 import os
 import select
+import socket
+import threading
+import weakref
 
 
 MAX_UDP_BULKSIZE = 65535 - 8 - 20
 
+# Maximum number of packets sent back to back per pacing period, as
+# enforced by the iperf3 command line
+MAX_BURST = 1000
+
+# Accepted reporting/statistics intervals in seconds, 0 disables them
+MIN_INTERVAL = 0.1
+MAX_INTERVAL = 60
+
+# The C library of the running process, used to wrap the per-instance
+# capture pipe in a FILE* for libiperf's outfile setter
+libc = CDLL(None)
+libc.fdopen.restype = c_void_p
+libc.fdopen.argtypes = (c_int, c_char_p)
+libc.fflush.restype = c_int
+libc.fflush.argtypes = (c_void_p,)
+libc.fclose.restype = c_int
+libc.fclose.argtypes = (c_void_p,)
+
+# Serialises the process wide stdout redirection fallback used with
+# libiperf builds lacking iperf_set_test_outfile
+_stdout_lock = threading.Lock()
+
+# Initial size of the buffer used to capture libiperf output. It doubles
+# whenever a test produces more output than currently fits.
+CAPTURE_BUFSIZE = 64 * 1024
+
 
 def more_data(pipe_out):
     """Check if there is more data left on the pipe
@@ -24,16 +65,142 @@ def read_pipe(pipe_out):
     :param pipe_out: The os pipe_out
     :rtype: unicode string
     """
-    out = b""
+    out = bytearray()
     while more_data(pipe_out):
-        out += os.read(pipe_out, 1024)
+        chunk = os.read(pipe_out, CAPTURE_BUFSIZE)
+        if not chunk:
+            break
+        out += chunk
 
     return out.decode("utf-8")
 
 
+def extract_json(data):
+    """Strip any text libiperf printed ahead of the json document
+
+    Older libiperf versions write messages such as "Control connection
+    MSS" to stdout before the json result.
+
+    :param data: The captured output
+    :rtype: unicode string
+    """
+    if data and not data.startswith("{") and "{" in data:
+        data = "{" + data.split("{", 1)[1]
+    return data
+
+
+class PipeReader(object):
+    """Drains a pipe on a background thread while libiperf writes to it
+
+    libiperf blocks once the kernel pipe buffer is full, so the output of a
+    test has to be consumed while the test is running rather than after it
+    returns. Data is read straight into a preallocated buffer which grows
+    by doubling, avoiding repeated bytes concatenation.
+
+    Basic Usage::
+
+      >>> reader = PipeReader(pipe_out)
+      >>> reader.start()
+      >>> lib.iperf_run_client(test)
+      >>> data = reader.stop()
+    """
+
+    def __init__(self, pipe_out, bufsize=CAPTURE_BUFSIZE, on_data=None):
+        """Initialise the reader
+
+        :param pipe_out: The read end of the pipe libiperf writes to
+        :param bufsize: Initial capture buffer size in bytes
+        :param on_data: optional callable receiving each chunk (bytes) as
+            it is read, called from the reader thread
+        """
+        self._pipe_out = pipe_out
+        self._buffer = bytearray(bufsize)
+        self._length = 0
+        self._on_data = on_data
+        self._error = None
+        self._wake_out = None
+        self._wake_in = None
+        self._thread = None
+
+    def start(self):
+        """Start draining the pipe on a daemon thread"""
+        self._length = 0
+        self._error = None
+        self._wake_out, self._wake_in = os.pipe()
+        self._thread = threading.Thread(target=self._drain)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop the reader once all pending output has been consumed
+
+        Exceptions raised by the ``on_data`` callback are re-raised here.
+
+        :rtype: unicode string
+        """
+        os.write(self._wake_in, b"x")
+        self._thread.join()
+        self._thread = None
+
+        os.close(self._wake_out)
+        os.close(self._wake_in)
+        self._wake_out = self._wake_in = None
+
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+        return self.data
+
+    @property
+    def data(self):
+        """The output captured so far
+
+        :rtype: unicode string
+        """
+        return bytes(self._buffer[: self._length]).decode("utf-8", "replace")
+
+    def _read_chunk(self):
+        """Read whatever is available on the pipe into the buffer
+
+        :rtype: int, the number of bytes read (0 on EOF)
+        """
+        if self._length == len(self._buffer):
+            self._buffer.extend(bytes(len(self._buffer) or CAPTURE_BUFSIZE))
+
+        with memoryview(self._buffer) as view:
+            read = os.readv(self._pipe_out, [view[self._length :]])
+
+        if read and self._on_data is not None and self._error is None:
+            try:
+                self._on_data(bytes(self._buffer[self._length : self._length + read]))
+            except Exception as e:
+                # Keep draining, libiperf would block on a full pipe otherwise
+                self._error = e
+
+        self._length += read
+        return read
+
+    def _drain(self):
+        """Thread target, reads until stopped or the pipe is closed"""
+        while True:
+            r, _, _ = select.select([self._pipe_out, self._wake_out], [], [])
+            if self._pipe_out in r:
+                if not self._read_chunk():
+                    break
+            elif self._wake_out in r:
+                # Pick up anything written just before the stop request
+                while more_data(self._pipe_out) and self._read_chunk():
+                    pass
+                break
+
+
 def output_to_pipe(pipe_in):
     """Redirects stdout and stderr to a pipe
 
+    .. note:: This affects the whole process, instances capture their
+       output through libiperf's outfile setter whenever available
+
     :param pipe_out: The pipe to redirect stdout and stderr to
     """
     os.dup2(pipe_in, 1)  # stdout
@@ -50,200 +217,479 @@ def output_to_screen(stdout_fd, stderr_fd):
     # os.dup2(stderr_fd, 2)
 
 
-class IPerf3(object):
-    """The base class used by both the iperf3 :class:`Server` and :class:`Client`
+class JsonStreamParser(object):
+    """Incrementally decodes libiperf json output
 
-    .. note:: You should not use this class directly
+    Handles both the event lines produced by libiperf's json stream mode
+    (iperf >= 3.17) and the single json document written by older
+    versions. Every interval found is passed to ``on_interval`` as a dict
+    with the ``streams`` and ``sum`` keys of the libiperf interval.
     """
 
-    def __init__(self, role, verbose=True, lib_name=None):
-        """Initialise the iperf shared library
+    def __init__(self, on_interval=None):
+        """Initialise the parser
 
-        :param role: 'c' = client; 's' = server
-        :param verbose: enable verbose output
-        :param lib_name: optional name and path for libiperf.so.0 library
+        :param on_interval: optional callable receiving each interval
         """
-        if lib_name is None:
-            lib_name = util.find_library("libiperf")
-            if lib_name is None:
+        self.on_interval = on_interval
+        self.start = None
+        self.intervals = []
+        self.end = None
+        self.error = None
+        self._document = None
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")("replace")
+        # Pieces of the current line and complete lines of the current
+        # document, joined only when a document may have ended
+        self._line = []
+        self._lines = []
+
+    def feed(self, data):
+        """Feed a chunk of libiperf output to the parser
+
+        :param data: bytes as read from the capture pipe
+        """
+        text = self._utf8.decode(data)
+        if "\n" not in text:
+            self._line.append(text)
+            return
+
+        lines = text.split("\n")
+        self._line.append(lines[0])
+        self._add_line("".join(self._line))
+        for line in lines[1:-1]:
+            self._add_line(line)
+        self._line = [lines[-1]]
+
+    def _add_line(self, line):
+        """Collect a complete line, decoding the document it may end
+
+        Stream events are single lines, the closing brace of a complete
+        document is the only unindented one.
+        """
+        if not self._lines:
+            start = line.find("{")
+            if start < 0:
+                # Text printed ahead of the json
+                return
+            line = line[start:]
+
+        self._lines.append(line)
+        stripped = line.rstrip()
+        if stripped.endswith("}") and (len(self._lines) == 1 or stripped == "}"):
+            self._decode()
+
+    def _decode(self):
+        """Decode the collected lines, kept when they are incomplete"""
+        try:
+            obj = self._decoder.decode("\n".join(self._lines))
+        except ValueError:
+            return
+        self._lines = []
+        self._handle(obj)
+
+    def _handle(self, obj):
+        """Dispatch a decoded json object"""
+        if "event" in obj:
+            event, data = obj["event"], obj.get("data")
+            if event == "start":
+                self.start = data
+            elif event == "interval":
+                self._interval(data)
+            elif event == "end":
+                self.end = data
+            elif event == "error":
+                self.error = data
+        else:
+            self._document = obj
+            self.start = obj.get("start")
+            self.end = obj.get("end")
+            self.error = obj.get("error")
+            for interval in obj.get("intervals", []):
+                self._interval(interval)
+
+    def _interval(self, interval):
+        self.intervals.append(interval)
+        if self.on_interval is not None:
+            self.on_interval(interval)
+
+    @property
+    def document(self):
+        """The complete json document as text, None if nothing was parsed
+
+        Events received in json stream mode are assembled into the same
+        document libiperf produces without streaming.
+
+        :rtype: unicode string
+        """
+        if self._line:
+            # Output not terminated by a newline
+            self._add_line("".join(self._line))
+            self._line = []
+        if self.error is not None:
+            return json.dumps({"error": self.error})
+        if self._document is not None:
+            return json.dumps(self._document)
+        if self.start is None:
+            return None
+        return json.dumps(
+            {"start": self.start, "intervals": self.intervals, "end": self.end or {}}
+        )
+
+
+# ctypes prototypes for the libiperf functions used by the wrapper as
+# (name, restype, argtypes)
+PROTOTYPES = (
+    ("iperf_client_end", c_int, (c_void_p,)),
+    ("iperf_free_test", None, (c_void_p,)),
+    ("iperf_new_test", c_void_p, None),
+    ("iperf_defaults", c_int, (c_void_p,)),
+    ("iperf_get_test_role", c_char, (c_void_p,)),
+    ("iperf_set_test_role", None, (c_void_p, c_char)),
+    ("iperf_get_test_bind_address", c_char_p, (c_void_p,)),
+    ("iperf_set_test_bind_address", None, (c_void_p, c_char_p)),
+    ("iperf_get_test_server_port", c_int, (c_void_p,)),
+    ("iperf_set_test_server_port", None, (c_void_p, c_int)),
+    ("iperf_get_test_json_output", c_int, (c_void_p,)),
+    ("iperf_set_test_json_output", None, (c_void_p, c_int)),
+    ("iperf_get_verbose", c_int, (c_void_p,)),
+    ("iperf_set_verbose", None, (c_void_p, c_int)),
+    ("iperf_strerror", c_char_p, (c_int,)),
+    ("iperf_get_test_server_hostname", c_char_p, (c_void_p,)),
+    ("iperf_set_test_server_hostname", None, (c_void_p, c_char_p)),
+    ("iperf_get_test_protocol_id", c_int, (c_void_p,)),
+    ("set_protocol", c_int, (c_void_p, c_int)),
+    ("iperf_get_test_omit", c_int, (c_void_p,)),
+    ("iperf_set_test_omit", None, (c_void_p, c_int)),
+    ("iperf_get_test_duration", c_int, (c_void_p,)),
+    ("iperf_set_test_duration", None, (c_void_p, c_int)),
+    ("iperf_get_test_rate", c_uint64, (c_void_p,)),
+    ("iperf_set_test_rate", None, (c_void_p, c_uint64)),
+    ("iperf_get_test_blksize", c_int, (c_void_p,)),
+    ("iperf_set_test_blksize", None, (c_void_p, c_int)),
+    ("iperf_get_test_num_streams", c_int, (c_void_p,)),
+    ("iperf_set_test_num_streams", None, (c_void_p, c_int)),
+    ("iperf_has_zerocopy", c_int, None),
+    ("iperf_set_test_zerocopy", None, (c_void_p, c_int)),
+    ("iperf_get_test_reverse", c_int, (c_void_p,)),
+    ("iperf_set_test_reverse", None, (c_void_p, c_int)),
+    ("iperf_run_client", c_int, (c_void_p,)),
+    ("iperf_run_server", c_int, (c_void_p,)),
+    ("iperf_reset_test", None, (c_void_p,)),
+)
+
+# Prototypes only present in some libiperf versions, skipped when missing
+OPTIONAL_PROTOTYPES = (
+    ("iperf_get_control_socket", c_int, (c_void_p,)),
+    ("iperf_setaffinity", c_int, (c_void_p, c_int)),
+    ("iperf_clearaffinity", c_int, (c_void_p,)),
+    # iperf v3.1 and onwards
+    ("iperf_get_test_json_output_string", c_char_p, (c_void_p,)),
+    ("iperf_get_test_outfile", c_void_p, (c_void_p,)),
+    ("iperf_set_test_outfile", None, (c_void_p, c_void_p)),
+    ("iperf_get_test_reporter_interval", c_double, (c_void_p,)),
+    ("iperf_set_test_reporter_interval", None, (c_void_p, c_double)),
+    ("iperf_get_test_stats_interval", c_double, (c_void_p,)),
+    ("iperf_set_test_stats_interval", None, (c_void_p, c_double)),
+    ("iperf_get_test_socket_bufsize", c_int, (c_void_p,)),
+    ("iperf_set_test_socket_bufsize", None, (c_void_p, c_int)),
+    ("iperf_get_test_mss", c_int, (c_void_p,)),
+    ("iperf_set_test_mss", None, (c_void_p, c_int)),
+    ("iperf_get_test_no_delay", c_int, (c_void_p,)),
+    ("iperf_set_test_no_delay", None, (c_void_p, c_int)),
+    ("iperf_get_test_congestion_control", c_char_p, (c_void_p,)),
+    ("iperf_set_test_congestion_control", None, (c_void_p, c_char_p)),
+    ("iperf_get_test_bytes", c_uint64, (c_void_p,)),
+    ("iperf_set_test_bytes", None, (c_void_p, c_uint64)),
+    ("iperf_get_test_blocks", c_uint64, (c_void_p,)),
+    ("iperf_set_test_blocks", None, (c_void_p, c_uint64)),
+    # iperf v3.2 and onwards
+    ("iperf_get_test_pacing_timer", c_int, (c_void_p,)),
+    ("iperf_set_test_pacing_timer", None, (c_void_p, c_int)),
+    ("iperf_get_test_burst", c_int, (c_void_p,)),
+    ("iperf_set_test_burst", None, (c_void_p, c_int)),
+    ("iperf_get_test_fqrate", c_uint64, (c_void_p,)),
+    ("iperf_set_test_fqrate", None, (c_void_p, c_uint64)),
+    # iperf v3.7 and onwards
+    ("iperf_get_test_bidirectional", c_int, (c_void_p,)),
+    ("iperf_set_test_bidirectional", None, (c_void_p, c_int)),
+    # iperf v3.8 and onwards
+    ("iperf_get_test_connect_timeout", c_int, (c_void_p,)),
+    ("iperf_set_test_connect_timeout", None, (c_void_p, c_int)),
+    # iperf v3.17 and onwards
+    ("iperf_get_test_json_stream", c_int, (c_void_p,)),
+    ("iperf_set_test_json_stream", None, (c_void_p, c_int)),
+)
+
+# Loaded and prototyped libraries, keyed by the requested lib_name
+_libraries = {}
+_libraries_lock = threading.Lock()
+
+
+def _prototype(lib, name, restype, argtypes):
+    """Set the C types of a single libiperf function"""
+    func = getattr(lib, name)
+    func.restype = restype
+    func.argtypes = argtypes
+
+
+def load_library(lib_name=None):
+    """Load and prototype libiperf, once per lib_name
+
+    Resolving the library forks ldconfig/gcc on Linux, so the loaded and
+    prototyped handle is cached and shared by every :class:`IPerf3`
+    instance using the same lib_name. Safe to call from multiple threads.
+
+    :param lib_name: optional name and path for libiperf.so.0 library
+    :rtype: ctypes.CDLL
+    """
+    lib = _libraries.get(lib_name)
+    if lib is not None:
+        return lib
+
+    with _libraries_lock:
+        lib = _libraries.get(lib_name)
+        if lib is not None:
+            return lib
+
+        path = lib_name
+        if path is None:
+            path = util.find_library("libiperf")
+            if path is None:
                 # If we still couldn't find it lets try the manual approach
-                lib_name = "libiperf.so.0"
+                path = "libiperf.so.0"
 
         try:
-            self.lib = cdll.LoadLibrary(lib_name)
+            lib = cdll.LoadLibrary(path)
         except OSError:
             raise OSError(
-                "Couldn't find shared library {}, is iperf3 installed?".format(lib_name)
+                "Couldn't find shared library {}, is iperf3 installed?".format(path)
             )
 
         # Set the appropriate C types.
-        self.lib.iperf_client_end.restype = c_int
-        self.lib.iperf_client_end.argtypes = (c_void_p,)
-        self.lib.iperf_free_test.restxpe = None
-        self.lib.iperf_free_test.argtypes = (c_void_p,)
-        self.lib.iperf_new_test.restype = c_void_p
-        self.lib.iperf_new_test.argtypes = None
-        self.lib.iperf_defaults.restype = c_int
-        self.lib.iperf_defaults.argtypes = (c_void_p,)
-        self.lib.iperf_get_test_role.restype = c_char
-        self.lib.iperf_get_test_role.argtypes = (c_void_p,)
-        self.lib.iperf_set_test_role.restype = None
-        self.lib.iperf_set_test_role.argtypes = (
-            c_void_p,
-            c_char,
-        )
-        self.lib.iperf_get_test_bind_address.restype = c_char_p
-        self.lib.iperf_get_test_bind_address.argtypes = (c_void_p,)
-        self.lib.iperf_set_test_bind_address.restype = None
-        self.lib.iperf_set_test_bind_address.argtypes = (
-            c_void_p,
-            c_char_p,
-        )
-        self.lib.iperf_get_test_server_port.restype = c_int
-        self.lib.iperf_get_test_server_port.argtypes = (c_void_p,)
-        self.lib.iperf_set_test_server_port.restype = None
-        self.lib.iperf_set_test_server_port.argtypes = (
-            c_void_p,
-            c_int,
-        )
-        self.lib.iperf_get_test_json_output.restype = c_int
-        self.lib.iperf_get_test_json_output.argtypes = (c_void_p,)
-        self.lib.iperf_set_test_json_output.restype = None
-        self.lib.iperf_set_test_json_output.argtypes = (
-            c_void_p,
-            c_int,
-        )
-        self.lib.iperf_get_verbose.restype = c_int
-        self.lib.iperf_get_verbose.argtypes = (c_void_p,)
-        self.lib.iperf_set_verbose.restype = None
-        self.lib.iperf_set_verbose.argtypes = (c_void_p, c_int)
-        self.lib.iperf_strerror.restype = c_char_p
-        self.lib.iperf_strerror.argtypes = (c_int,)
-        self.lib.iperf_get_test_server_hostname.restype = c_char_p
-        self.lib.iperf_get_test_server_hostname.argtypes = (c_void_p,)
-        self.lib.iperf_set_test_server_hostname.restype = None
-        self.lib.iperf_set_test_server_hostname.argtypes = (
-            c_void_p,
-            c_char_p,
-        )
-        self.lib.iperf_get_test_protocol_id.restype = c_int
-        self.lib.iperf_get_test_protocol_id.argtypes = (c_void_p,)
-        self.lib.set_protocol.restype = c_int
-        self.lib.set_protocol.argtypes = (
-            c_void_p,
-            c_int,
-        )
-        self.lib.iperf_get_test_omit.restype = c_int
-        self.lib.iperf_get_test_omit.argtypes = (c_void_p,)
-        self.lib.iperf_set_test_omit.restype = None
-        self.lib.iperf_set_test_omit.argtypes = (
-            c_void_p,
-            c_int,
-        )
-        self.lib.iperf_get_test_duration.restype = c_int
-        self.lib.iperf_get_test_duration.argtypes = (c_void_p,)
-        self.lib.iperf_set_test_duration.restype = None
-        self.lib.iperf_set_test_duration.argtypes = (
-            c_void_p,
-            c_int,
-        )
-        self.lib.iperf_get_test_rate.restype = c_uint64
-        self.lib.iperf_get_test_rate.argtypes = (c_void_p,)
-        self.lib.iperf_set_test_rate.restype = None
-        self.lib.iperf_set_test_rate.argtypes = (
-            c_void_p,
-            c_uint64,
-        )
-        self.lib.iperf_get_test_blksize.restype = c_int
-        self.lib.iperf_get_test_blksize.argtypes = (c_void_p,)
-        self.lib.iperf_set_test_blksize.restype = None
-        self.lib.iperf_set_test_blksize.argtypes = (
-            c_void_p,
-            c_int,
-        )
-        self.lib.iperf_get_test_num_streams.restype = c_int
-        self.lib.iperf_get_test_num_streams.argtypes = (c_void_p,)
-        self.lib.iperf_set_test_num_streams.restype = None
-        self.lib.iperf_set_test_num_streams.argtypes = (
-            c_void_p,
-            c_int,
-        )
-        self.lib.iperf_has_zerocopy.restype = c_int
-        self.lib.iperf_has_zerocopy.argtypes = None
-        self.lib.iperf_set_test_zerocopy.restype = None
-        self.lib.iperf_set_test_zerocopy.argtypes = (
-            c_void_p,
-            c_int,
-        )
-        self.lib.iperf_get_test_reverse.restype = c_int
-        self.lib.iperf_get_test_reverse.argtypes = (c_void_p,)
-        self.lib.iperf_set_test_reverse.restype = None
-        self.lib.iperf_set_test_reverse.argtypes = (
-            c_void_p,
-            c_int,
-        )
-        self.lib.iperf_run_client.restype = c_int
-        self.lib.iperf_run_client.argtypes = (c_void_p,)
-        self.lib.iperf_run_server.restype = c_int
-        self.lib.iperf_run_server.argtypes = (c_void_p,)
-        self.lib.iperf_reset_test.restype = None
-        self.lib.iperf_reset_test.argtypes = (c_void_p,)
+        for name, restype, argtypes in PROTOTYPES:
+            _prototype(lib, name, restype, argtypes)
 
-        try:
-            # Only available from iperf v3.1 and onwards
-            self.lib.iperf_get_test_json_output_string.restype = c_char_p
-            self.lib.iperf_get_test_json_output_string.argtypes = (c_void_p,)
-        except AttributeError:
-            pass
+        for name, restype, argtypes in OPTIONAL_PROTOTYPES:
+            try:
+                _prototype(lib, name, restype, argtypes)
+            except AttributeError:
+                pass
 
-        # The test C struct iperf_test
-        self._test = self._new()
-        self.defaults()
+        _libraries[lib_name] = lib
+        return lib
+
+
+def preload(lib_name=None):
+    """Pre-warm the library registry, e.g. at application startup
+
+    Moves the cost of locating and prototyping libiperf out of the first
+    :class:`Client` or :class:`Server` instantiation.
+
+    :param lib_name: optional name and path for libiperf.so.0 library
+    :rtype: ctypes.CDLL
+    """
+    return load_library(lib_name)
+
+
+# Number of allocated libiperf tests, see live_tests()
+_live_tests = 0
+_live_tests_lock = threading.Lock()
+
+
+def live_tests():
+    """The number of libiperf tests currently allocated
+
+    Meant for debugging, e.g. to confirm instances don't leak under load.
+
+    :rtype: int
+    """
+    return _live_tests
+
+
+def _release(lib, test, fds, pipe_in, outfile):
+    """Free the native resources of an :class:`IPerf3` instance"""
+    global _live_tests
+
+    for fd in fds:
+        os.close(fd)
+    if outfile:
+        libc.fclose(outfile)  # closes pipe_in as well
+    else:
+        os.close(pipe_in)
+
+    # No iperf_client_end here: iperf_run_client already calls it at the
+    # end of every run, failed ones included. Calling it again closes the
+    # stream and control socket fd numbers a second time, which the kernel
+    # may have handed to another instance's socket or pipe by now. A test
+    # that never ran has nothing to end.
+    lib.iperf_free_test(test)
+
+    with _live_tests_lock:
+        _live_tests -= 1
+
+
+class IPerf3(object):
+    """The base class used by both the iperf3 :class:`Server` and :class:`Client`
+
+    .. note:: You should not use this class directly
+    """
+
+    # Settings kept across iperf_reset_test, in the order they are applied
+    settings = (
+        "port",
+        "bind_address",
+        "json_output",
+        "verbose",
+        "reporter_interval",
+        "stats_interval",
+        "affinity",
+    )
+
+    def __init__(self, role, verbose=True, lib_name=None):
+        """Initialise the iperf shared library
+
+        :param role: 'c' = client; 's' = server
+        :param verbose: enable verbose output
+        :param lib_name: optional name and path for libiperf.so.0 library
+        """
+        self.lib = load_library(lib_name)
+
+        # The test C struct iperf_test, accessed through _test
+        self._test_struct = self._new()
 
         # stdout/strerr redirection variables
         self._stdout_fd = os.dup(1)
         self._stderr_fd = os.dup(2)
         self._pipe_out, self._pipe_in = os.pipe()  # no need for pipe write
 
+        # Per instance output capture, libiperf writes to a FILE* wrapping
+        # our own pipe rather than to the process wide stdout
+        self._outfile = None
+        if hasattr(self.lib, "iperf_set_test_outfile"):
+            self._outfile = libc.fdopen(self._pipe_in, b"w")
+
+        # Releases the native resources on close() or garbage collection,
+        # holds no reference to self
+        self._finalizer = weakref.finalize(
+            self,
+            _release,
+            self.lib,
+            self._test_struct,
+            (self._stdout_fd, self._stderr_fd, self._pipe_out),
+            self._pipe_in,
+            self._outfile,
+        )
+        self.defaults()
+
+        # CPU core the test runs on, -1 when not pinned
+        self._affinity = -1
+
         # Generic test settings
         self.role = role
         self.json_output = True
         self.verbose = verbose
 
-    def __del__(self):
-        """Cleanup the test after the :class:`IPerf3` class is terminated"""
-        os.close(self._stdout_fd)
-        os.close(self._stderr_fd)
-        os.close(self._pipe_out)
-        os.close(self._pipe_in)
+    def __enter__(self):
+        return self
 
-        try:
-            # In the current version of libiperf, the control socket isn't
-            # closed on iperf_client_end(), see proposed pull request:
-            # https://github.com/esnet/iperf/pull/597
-            # Workaround for testing, don't ever do this..:
-            #
-            # sck=self.lib.iperf_get_control_socket(self._test)
-            # os.close(sck)
-
-            self.lib.iperf_client_end(self._test)
-            self.lib.iperf_free_test(self._test)
-        except AttributeError:
-            # self.lib doesn't exist, likely because iperf3 wasn't installed or
-            # the shared library libiperf.so.0 could not be found
-            pass
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Free the libiperf test and close the capture fds
+
+        Safe to call more than once. The instance can't be used afterwards,
+        accessing its settings raises ValueError. It must not be closed
+        while a test is running. Instances that are never closed are
+        cleaned up once garbage collected.
+        """
+        self._finalizer()
+
+    def _ensure_open(self):
+        """Raise ValueError once the instance has been closed"""
+        if not self._finalizer.alive:
+            raise ValueError("Can't use a closed iperf3 instance")
+
+    @property
+    def closed(self):
+        """True once the native resources have been released
+
+        :rtype: bool
+        """
+        return not self._finalizer.alive
+
+    @property
+    def _test(self):
+        """The libiperf test struct, guarded against use after close
+
+        :raises ValueError: once the instance has been closed
+        """
+        self._ensure_open()
+        return self._test_struct
 
     def _new(self):
         """Initialise a new iperf test
 
         struct iperf_test *iperf_new_test()
         """
-        return self.lib.iperf_new_test()
+        global _live_tests
+
+        test = self.lib.iperf_new_test()
+        with _live_tests_lock:
+            _live_tests += 1
+        return test
 
     def defaults(self):
         """Set/reset iperf test defaults."""
         self.lib.iperf_defaults(self._test)
 
+    def get_settings(self):
+        """The current test configuration
+
+        :rtype: dict of :attr:`settings` names and values
+        """
+        self._ensure_open()
+        settings = {}
+        for name in self.settings:
+            try:
+                settings[name] = getattr(self, name)
+            except NotImplementedError:
+                # Not supported by the loaded libiperf
+                pass
+        return settings
+
+    def apply_settings(self, settings):
+        """Apply a test configuration as returned by :meth:`get_settings`
+
+        :param settings: dict of property names and values
+        """
+        self._ensure_open()
+        unknown = set(settings) - set(self.settings)
+        if unknown:
+            raise ValueError("Unknown settings: {}".format(sorted(unknown)))
+
+        for name in self.settings:
+            value = settings.get(name)
+            if value is None:
+                continue
+            if name == "bind_address" and value == "*":
+                # Reported for an unset bind address
+                continue
+            setattr(self, name, value)
+
+    def _reset_test(self):
+        """Reset the libiperf test so it can run again
+
+        iperf_reset_test restores libiperf's defaults, the configuration
+        is saved beforehand and applied again afterwards.
+        """
+        role = self.role
+        settings = self.get_settings()
+        self.lib.iperf_reset_test(self._test)
+        self.role = role
+        self.apply_settings(settings)
+
     @property
     def role(self):
         """The iperf3 instance role
@@ -355,6 +801,111 @@ class IPerf3(object):
             self.lib.iperf_set_verbose(self._test, 0)
         self._verbose = enabled
 
+    def _require(self, name):
+        """Return a libiperf function missing from some library versions
+
+        :rtype: the ctypes function
+        :raises NotImplementedError: when the loaded libiperf lacks it
+        :raises ValueError: once the instance has been closed
+        """
+        self._ensure_open()
+        try:
+            return getattr(self.lib, name)
+        except AttributeError:
+            raise NotImplementedError(
+                "{} is not supported by {}".format(name, self.iperf_version)
+            )
+
+    @staticmethod
+    def _check_interval(interval):
+        interval = float(interval)
+        if interval != 0 and not MIN_INTERVAL <= interval <= MAX_INTERVAL:
+            raise ValueError(
+                "Interval has to be 0 (disabled) or between {} and {} "
+                "seconds".format(MIN_INTERVAL, MAX_INTERVAL)
+            )
+        return interval
+
+    @property
+    def reporter_interval(self):
+        """Seconds between interval reports, 0 disables them
+
+        Together with :attr:`stats_interval` this is the ``-i`` option of
+        the iperf3 command line, which sets both to the same value.
+
+        :rtype: float
+        """
+        return self._require("iperf_get_test_reporter_interval")(self._test)
+
+    @reporter_interval.setter
+    def reporter_interval(self, interval):
+        interval = self._check_interval(interval)
+        self._require("iperf_set_test_reporter_interval")(self._test, interval)
+
+    @property
+    def stats_interval(self):
+        """Seconds between statistics samples, 0 disables them
+
+        :rtype: float
+        """
+        return self._require("iperf_get_test_stats_interval")(self._test)
+
+    @stats_interval.setter
+    def stats_interval(self, interval):
+        interval = self._check_interval(interval)
+        self._require("iperf_set_test_stats_interval")(self._test, interval)
+
+    @property
+    def affinity(self):
+        """The CPU core the test runs on, -1 when not pinned
+
+        Like the ``-A`` option of the iperf3 command line. The thread
+        running the test, and the stream threads libiperf starts from it,
+        are pinned to the core for the duration of :meth:`run`.
+
+        libiperf has no API for the server side core of ``-A n,m``, pin
+        the :class:`Server` instance instead.
+
+        :rtype: int
+        """
+        return self._affinity
+
+    @affinity.setter
+    def affinity(self, core):
+        core = int(core)
+        if core < -1:
+            raise ValueError("affinity has to be a CPU core or -1 to unpin")
+        if not hasattr(os, "sched_setaffinity"):
+            self._require("iperf_setaffinity")
+        self._affinity = core
+
+    def _pin(self):
+        """Pin the calling thread to :attr:`affinity`
+
+        :rtype: the previous CPU mask to pass to :meth:`_unpin`, None when
+            the thread wasn't pinned
+        """
+        if self._affinity < 0:
+            return None
+
+        if hasattr(os, "sched_setaffinity"):
+            previous = os.sched_getaffinity(0)
+            os.sched_setaffinity(0, {self._affinity})
+            return previous
+
+        if self.lib.iperf_setaffinity(self._test, self._affinity) != 0:
+            raise OSError(self._error_to_string(self._errno))
+        return ()
+
+    def _unpin(self, previous):
+        """Restore the CPU mask returned by :meth:`_pin`"""
+        if previous is None:
+            return
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, previous)
+        else:
+            self.lib.iperf_clearaffinity(self._test)
+
     @property
     def _errno(self):
         """Returns the last error ID
@@ -379,9 +930,92 @@ class IPerf3(object):
         :param error_id: The error_id produced by libiperf
         :rtype: string
         """
-        strerror = self.lib.iperf_strerror
-        strerror.restype = c_char_p
-        return strerror(error_id).decode("utf-8")
+        return self.lib.iperf_strerror(error_id).decode("utf-8")
+
+    def _run_captured(self, run, on_data=None):
+        """Run a libiperf entry point while capturing its output
+
+        The output is written to this instance's own pipe through
+        iperf_set_test_outfile, leaving fd 1 untouched so several instances
+        can run concurrently. Libraries without the outfile setter fall
+        back to redirecting stdout, serialised across instances. The calling
+        thread is pinned to :attr:`affinity` while the test runs.
+
+        :param run: The libiperf function to call with the test struct
+        :param on_data: optional callable receiving each captured chunk
+        :rtype: tuple of the libiperf return code and the captured output
+        """
+        self._ensure_open()
+        reader = PipeReader(self._pipe_out, on_data=on_data)
+        previous = self._pin()
+        try:
+            if self._outfile:
+                outfile = self.lib.iperf_get_test_outfile(self._test)
+                self.lib.iperf_set_test_outfile(self._test, self._outfile)
+                reader.start()
+                try:
+                    error = run(self._test)
+                finally:
+                    libc.fflush(self._outfile)
+                    self.lib.iperf_set_test_outfile(self._test, outfile)
+                    data = reader.stop()
+            else:
+                with _stdout_lock:
+                    reader.start()
+                    output_to_pipe(self._pipe_in)  # disable stdout
+                    try:
+                        error = run(self._test)
+                    finally:
+                        output_to_screen(self._stdout_fd, self._stderr_fd)
+                        data = reader.stop()
+        finally:
+            self._unpin(previous)
+
+        return error, data
+
+    def _json_output_string(self):
+        """The json result kept by libiperf, None when unavailable
+
+        Only available from iperf v3.1 and onwards
+
+        :rtype: unicode string
+        """
+        if not hasattr(self.lib, "iperf_get_test_json_output_string"):
+            return None
+
+        output = c_char_p(self.lib.iperf_get_test_json_output_string(self._test))
+        if output.value:
+            return output.value.decode("utf-8")
+        return None
+
+    def stop(self):
+        """Interrupt a test running in another thread
+
+        Shuts down the control connection, which makes libiperf end the
+        running test with an error. Does nothing when no control
+        connection is established.
+
+        :raises ValueError: once the instance has been closed
+        """
+        self._ensure_open()
+        if not hasattr(self.lib, "iperf_get_control_socket"):
+            return
+
+        sck = self.lib.iperf_get_control_socket(self._test)
+        if sck < 0:
+            return
+
+        try:
+            control = socket.socket(fileno=os.dup(sck))
+        except OSError:
+            return
+
+        try:
+            control.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        finally:
+            control.close()
 
     def run(self):
         """Runs the iperf3 instance.
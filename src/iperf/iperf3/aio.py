@@ -0,0 +1,164 @@
+import asyncio
+import functools
+
+from iperf.iperf3.client import Client
+from iperf.iperf3.server import Server
+from iperf.iperf3.test_result import TestResult
+
+
+class _AsyncWrapper(object):
+    """Proxies settings to a blocking iperf3 instance run in an executor
+
+    .. note:: You should not use this class directly
+    """
+
+    def __init__(self, instance, executor=None):
+        object.__setattr__(self, "_instance", instance)
+        object.__setattr__(self, "executor", executor)
+
+    def __getattr__(self, name):
+        return getattr(self._instance, name)
+
+    def __setattr__(self, name, value):
+        if name in ("executor", "result"):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._instance, name, value)
+
+    async def _run_in_executor(self, func):
+        """Run a blocking libiperf call, stopping the test on cancellation
+
+        Completion is signalled through the event loop future of the
+        executor job, no polling is involved.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, func)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            self._instance.stop()
+            try:
+                await future
+            except Exception:
+                pass
+            raise
+
+
+class AsyncClient(_AsyncWrapper):
+    """An asyncio iperf3 client connection.
+
+    Settings are the same as for :class:`Client`, libiperf runs in an
+    executor so the event loop is never blocked. Cancelling the awaiting
+    task interrupts the running test.
+
+    Basic Usage::
+
+      >>> from iperf.iperf3.aio import AsyncClient
+
+      >>> client = AsyncClient()
+      >>> client.server_hostname = '127.0.0.1'
+      >>> client.duration = 1
+      >>> result = await client.run()
+
+      >>> async for interval in client.stream():
+      ...     print(interval['sum']['bits_per_second'])
+      >>> client.result
+      {'start': {...
+    """
+
+    def __init__(self, *args, **kwargs):
+        """Initialise the iperf3 client
+
+        :param executor: optional :class:`concurrent.futures.Executor` to run
+            libiperf in, defaults to the event loop's default executor
+
+        Other arguments are passed on to :class:`Client`.
+        """
+        executor = kwargs.pop("executor", None)
+        super(AsyncClient, self).__init__(Client(*args, **kwargs), executor)
+        self.result = None
+
+    async def run(self, on_interval=None):
+        """Run the current test client.
+
+        :param on_interval: optional callable receiving each interval,
+            called from the executor thread
+        :rtype: instance of :class:`TestResult`
+        """
+        self.result = await self._run_in_executor(
+            functools.partial(self._instance.run, on_interval)
+        )
+        return self.result
+
+    async def stream(self):
+        """Run the current test client, yielding intervals as they arrive.
+
+        The :class:`TestResult` is available as :attr:`result` once the
+        iteration completes. Leaving the iteration early stops the test.
+
+        :rtype: async generator
+        """
+        loop = asyncio.get_running_loop()
+        intervals = asyncio.Queue()
+        done = object()
+
+        def _on_interval(interval):
+            loop.call_soon_threadsafe(intervals.put_nowait, interval)
+
+        self.result = None
+        future = loop.run_in_executor(
+            self.executor, functools.partial(self._instance.run, _on_interval)
+        )
+        future.add_done_callback(lambda _: intervals.put_nowait(done))
+
+        try:
+            while True:
+                interval = await intervals.get()
+                if interval is done:
+                    break
+                yield interval
+            self.result = future.result()
+        finally:
+            if not future.done():
+                self._instance.stop()
+                try:
+                    await future
+                except Exception:
+                    pass
+
+
+class AsyncServer(_AsyncWrapper):
+    """An asyncio iperf3 server connection.
+
+    Settings are the same as for :class:`Server`. Cancelling the awaiting
+    task stops the server, also while it is waiting for a client.
+
+    Basic Usage::
+
+      >>> from iperf.iperf3.aio import AsyncServer
+
+      >>> server = AsyncServer()
+      >>> server.port = 5201
+      >>> result = await server.run()
+    """
+
+    def __init__(self, *args, **kwargs):
+        """Initialise the iperf3 server
+
+        :param executor: optional :class:`concurrent.futures.Executor` to run
+            libiperf in, defaults to the event loop's default executor
+
+        Other arguments are passed on to :class:`Server`.
+        """
+        executor = kwargs.pop("executor", None)
+        super(AsyncServer, self).__init__(Server(*args, **kwargs), executor)
+
+    async def run(self):
+        """Run the iperf3 server instance.
+
+        :rtype: instance of :class:`TestResult`
+        """
+        if not self._instance.json_output:
+            raise ValueError("AsyncServer requires json_output to be enabled")
+
+        return TestResult(await self._run_in_executor(self._instance._run_json))
@@ -0,0 +1,229 @@
+import json
+import mmap
+import os
+import struct
+from array import array
+
+from iperf.iperf3.test_result import INTERVAL_COLUMNS, SUMMARY_FIELDS, interval_columns
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+
+# Magic bytes of the array backed column file format
+ARRAY_MAGIC = b"IPRFCOL1"
+ARROW_MAGIC = b"ARROW1"
+
+# Summary columns archived for every successful result
+RESULT_FIELDS = tuple(name for name in SUMMARY_FIELDS if name != "error") + (
+    "reverse",
+    "type",
+)
+
+# Interval columns, ``result`` is the row of the result in the results table
+INTERVAL_FIELDS = ("result",) + tuple(name for name, _ in INTERVAL_COLUMNS)
+
+TABLES = ("results", "intervals")
+
+
+def _table_path(path, table, fmt):
+    return os.path.join(path, "{}.{}".format(table, fmt))
+
+
+def _columns(results, intervals):
+    """Collect the archived columns of a batch of results
+
+    :rtype: tuple of the results and intervals column dicts
+    """
+    summary = dict((name, []) for name in RESULT_FIELDS)
+    rows = dict((name, []) for name in INTERVAL_FIELDS)
+
+    for result in results:
+        if result.error:
+            continue
+
+        index = len(summary["protocol"])
+        for name in RESULT_FIELDS:
+            summary[name].append(getattr(result, name, None))
+
+        data = getattr(result, "json", None) if intervals else None
+        if not data:
+            continue
+
+        columns = interval_columns(data.get("intervals", []))
+        rows["result"].extend([index] * len(columns["start"]))
+        for name, _ in INTERVAL_COLUMNS:
+            rows[name].extend(columns[name])
+
+    return summary, rows
+
+
+def _write_array_table(path, columns):
+    """Write columns in the array backed format
+
+    The file starts with ``ARRAY_MAGIC``, a 4 byte little endian header
+    length and a json header describing every column. Column data follows,
+    8 byte aligned: numbers as float64 (NaN for missing values), strings
+    dictionary encoded as int32 codes (-1 for missing values).
+    """
+    header = {"rows": 0, "columns": []}
+    blobs = []
+    offset = 0
+
+    for name, values in columns.items():
+        header["rows"] = len(values)
+        column = {"name": name}
+
+        if any(isinstance(v, str) for v in values):
+            dictionary = sorted(set(v for v in values if v is not None))
+            codes = dict((v, i) for i, v in enumerate(dictionary))
+            data = array("i", (codes.get(v, -1) for v in values))
+            column["dictionary"] = dictionary
+        else:
+            nan = float("nan")
+            data = array("d", (nan if v is None else float(v) for v in values))
+
+        blob = data.tobytes()
+        column.update(typecode=data.typecode, offset=offset, length=len(data))
+        blobs.append(blob + b"\0" * (-len(blob) % 8))
+        offset += len(blobs[-1])
+        header["columns"].append(column)
+
+    encoded = json.dumps(header).encode("utf-8")
+    encoded += b" " * (-(len(ARRAY_MAGIC) + 4 + len(encoded)) % 8)
+
+    with open(path, "wb") as f:
+        f.write(ARRAY_MAGIC)
+        f.write(struct.pack("<I", len(encoded)))
+        f.write(encoded)
+        for blob in blobs:
+            f.write(blob)
+
+
+def _read_array_table(path, columns):
+    """Memory map an array backed column file
+
+    Numeric columns are returned as memoryviews on the mapped file, only
+    the requested columns are touched.
+    """
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    (length,) = struct.unpack_from("<I", mapped, len(ARRAY_MAGIC))
+    start = len(ARRAY_MAGIC) + 4
+    header = json.loads(mapped[start : start + length].decode("utf-8"))
+    data = memoryview(mapped)[start + length :]
+
+    output = {}
+    for column in header["columns"]:
+        if columns is not None and column["name"] not in columns:
+            continue
+
+        size = array(column["typecode"]).itemsize
+        view = data[column["offset"] : column["offset"] + column["length"] * size]
+        view = view.cast(column["typecode"])
+
+        if "dictionary" in column:
+            dictionary = column["dictionary"]
+            output[column["name"]] = [dictionary[c] if c >= 0 else None for c in view]
+        else:
+            output[column["name"]] = view
+
+    return output
+
+
+def _write_arrow_table(path, columns):
+    table = pyarrow.table(columns)
+    with pyarrow.OSFile(path, "wb") as sink:
+        with pyarrow.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def _read_arrow_table(path, columns):
+    # The memory map has to outlive the returned zero-copy columns
+    table = pyarrow.ipc.open_file(pyarrow.memory_map(path, "r")).read_all()
+    if columns is not None:
+        table = table.select([name for name in table.column_names if name in columns])
+    return dict((name, table.column(name)) for name in table.column_names)
+
+
+def write_archive(path, results, intervals=True, format=None):
+    """Write a batch of results to a columnar archive
+
+    The archive is a directory holding a ``results`` table with the summary
+    of every successful result and an ``intervals`` table with the interval
+    sums. Arrow IPC files are written when pyarrow is installed, the array
+    backed format otherwise.
+
+    Basic Usage::
+
+      >>> from iperf.iperf3.archive import read_archive, write_archive
+
+      >>> write_archive('archive/2024-01-01', results)
+      >>> columns = read_archive('archive/2024-01-01', ['remote_host', 'sent_bps'])
+
+    :param path: The archive directory, created if needed
+    :param results: iterable of :class:`TestResult`
+    :param intervals: also write the intervals table
+    :param format: 'arrow' or 'array', defaults to 'arrow' when available
+    """
+    if format is None:
+        format = "arrow" if pyarrow is not None else "array"
+    if format == "arrow" and pyarrow is None:
+        raise ImportError(
+            "pyarrow is required for the arrow format, "
+            "install it with: pip install iperf[arrow]"
+        )
+    if format not in ("arrow", "array"):
+        raise ValueError(
+            "Unknown archive format, accepted values are 'arrow' and 'array'"
+        )
+
+    os.makedirs(path, exist_ok=True)
+    write = _write_arrow_table if format == "arrow" else _write_array_table
+
+    summary, rows = _columns(results, intervals)
+    write(_table_path(path, "results", format), summary)
+    if intervals:
+        write(_table_path(path, "intervals", format), rows)
+
+
+def read_archive(path, columns=None, table="results"):
+    """Read columns of an archive table
+
+    Files are memory mapped, so only the requested columns are read from
+    disk. Arrow archives return pyarrow chunked arrays, array backed ones
+    memoryviews of float64 values (lists for text columns); both can be
+    wrapped with ``numpy.asarray`` without a copy.
+
+    :param path: The archive directory
+    :param columns: optional list of column names, all columns by default
+    :param table: 'results' or 'intervals'
+    :rtype: dict of column name and values
+    """
+    if table not in TABLES:
+        raise ValueError("Unknown table, accepted values are 'results' and 'intervals'")
+
+    for fmt in ("arrow", "array"):
+        table_path = _table_path(path, table, fmt)
+        if os.path.exists(table_path):
+            break
+    else:
+        raise IOError("No {} table found in archive {}".format(table, path))
+
+    with open(table_path, "rb") as f:
+        magic = f.read(len(ARRAY_MAGIC))
+
+    if magic == ARRAY_MAGIC:
+        return _read_array_table(table_path, columns)
+    if magic.startswith(ARROW_MAGIC):
+        if pyarrow is None:
+            raise ImportError(
+                "pyarrow is required to read arrow archives, "
+                "install it with: pip install iperf[arrow]"
+            )
+        return _read_arrow_table(table_path, columns)
+    raise ValueError("{} is not an iperf3 archive table".format(table_path))
@@ -1,15 +1,18 @@
 from iperf.iperf3.test_result import TestResult
 from iperf.iperf3._iperf3 import (
+    MAX_BURST,
     MAX_UDP_BULKSIZE,
     IPerf3,
-    output_to_pipe,
-    output_to_screen,
-    read_pipe,
+    JsonStreamParser,
+    extract_json,
 )
 
 
 from ctypes import c_char_p
+import json
+from queue import Queue
 from socket import SOCK_DGRAM, SOCK_STREAM
+import threading
 
 
 class Client(IPerf3):
@@ -29,6 +32,34 @@ class Client(IPerf3):
       {'intervals': [{'sum': {...
     """
 
+    # Settings kept across iperf_reset_test, in the order they are applied.
+    # protocol comes before blksize as it may clamp the blksize.
+    settings = (
+        ("server_hostname",)
+        + IPerf3.settings
+        + (
+            "protocol",
+            "blksize",
+            "num_streams",
+            "zerocopy",
+            "socket_bufsize",
+            "mss",
+            "no_delay",
+            "congestion_control",
+            "omit",
+            "duration",
+            "connect_timeout",
+            "num_bytes",
+            "num_blocks",
+            "bandwidth",
+            "fqrate",
+            "pacing_timer",
+            "burst",
+            "reverse",
+            "bidirectional",
+        )
+    )
+
     def __init__(self, *args, **kwargs):
         """Initialise the iperf shared library"""
         super(Client, self).__init__(role="c", *args, **kwargs)
@@ -44,6 +75,16 @@ class Client(IPerf3):
         self._bandwidth = None
         self._protocol = None
 
+        self._congestion_control = None
+        self._bidirectional = False
+
+        # Set once the libiperf test has run and needs a reset to run again
+        self._dirty = False
+
+        self._convergence = None
+        # num_bytes to restore after finish() ended a test through it
+        self._num_bytes_limit = None
+
     @property
     def server_hostname(self):
         """The server hostname to connect to.
@@ -117,6 +158,64 @@ class Client(IPerf3):
         self.lib.iperf_set_test_duration(self._test, duration)
         self._duration = duration
 
+    @property
+    def connect_timeout(self):
+        """Seconds to wait for the control connection (iperf >= 3.8)
+
+        None waits as long as the system's TCP connect does. Like the
+        ``--connect-timeout`` option of the iperf3 command line.
+
+        :rtype: float or None
+        """
+        timeout = self._require("iperf_get_test_connect_timeout")(self._test)
+        if timeout < 0:
+            return None
+        return timeout / 1000.0
+
+    @connect_timeout.setter
+    def connect_timeout(self, timeout):
+        if timeout is not None and timeout <= 0:
+            raise ValueError("connect_timeout has to be positive")
+        timeout = -1 if timeout is None else int(timeout * 1000)
+        self._require("iperf_set_test_connect_timeout")(self._test, timeout)
+
+    @property
+    def num_bytes(self):
+        """Number of bytes to transmit, 0 to run for :attr:`duration`
+
+        Ends the test once the given amount of data has been sent, instead
+        of after a fixed duration: :meth:`run` ignores :attr:`duration`
+        while a limit is set. The time it took is reported as
+        :attr:`TestResult.transfer_seconds`.
+
+        :rtype: int
+        """
+        return self._require("iperf_get_test_bytes")(self._test)
+
+    @num_bytes.setter
+    def num_bytes(self, num_bytes):
+        if num_bytes < 0:
+            raise ValueError("num_bytes can't be negative")
+        self._require("iperf_set_test_bytes")(self._test, int(num_bytes))
+
+    @property
+    def num_blocks(self):
+        """Number of blocks (of :attr:`blksize` bytes) to transmit, 0 to run
+        for :attr:`duration`
+
+        Like :attr:`num_bytes`, :meth:`run` ignores :attr:`duration` while
+        a limit is set.
+
+        :rtype: int
+        """
+        return self._require("iperf_get_test_blocks")(self._test)
+
+    @num_blocks.setter
+    def num_blocks(self, num_blocks):
+        if num_blocks < 0:
+            raise ValueError("num_blocks can't be negative")
+        self._require("iperf_set_test_blocks")(self._test, int(num_blocks))
+
     @property
     def bandwidth(self):
         """Target bandwidth in bits/sec"""
@@ -128,6 +227,57 @@ class Client(IPerf3):
         self.lib.iperf_set_test_rate(self._test, bandwidth)
         self._bandwidth = bandwidth
 
+    @property
+    def fqrate(self):
+        """Fair queueing based pacing rate in bits/sec, 0 disables it
+
+        Paces every stream in the kernel through ``SO_MAX_PACING_RATE``,
+        like the ``--fq-rate`` option of the iperf3 command line. Only
+        supported on Linux.
+
+        :rtype: int
+        """
+        return self._require("iperf_get_test_fqrate")(self._test)
+
+    @fqrate.setter
+    def fqrate(self, rate):
+        if rate < 0:
+            raise ValueError("fqrate can't be negative")
+        self._require("iperf_set_test_fqrate")(self._test, int(rate))
+
+    @property
+    def pacing_timer(self):
+        """Microseconds between the checks of the :attr:`bandwidth` pacing
+
+        Shorter periods send smaller, more frequent bursts, like the
+        ``--pacing-timer`` option of the iperf3 command line.
+
+        :rtype: int
+        """
+        return self._require("iperf_get_test_pacing_timer")(self._test)
+
+    @pacing_timer.setter
+    def pacing_timer(self, usecs):
+        if usecs <= 0:
+            raise ValueError("pacing_timer has to be a positive number")
+        self._require("iperf_set_test_pacing_timer")(self._test, int(usecs))
+
+    @property
+    def burst(self):
+        """Packets sent back to back per pacing period, 0 disables bursts
+
+        The ``/#`` suffix of the iperf3 command line ``-b`` option.
+
+        :rtype: int
+        """
+        return self._require("iperf_get_test_burst")(self._test)
+
+    @burst.setter
+    def burst(self, packets):
+        if not 0 <= packets <= MAX_BURST:
+            raise ValueError("burst has to be between 0 and {}".format(MAX_BURST))
+        self._require("iperf_set_test_burst")(self._test, int(packets))
+
     @property
     def blksize(self):
         """The test blksize."""
@@ -195,6 +345,71 @@ class Client(IPerf3):
             self.lib.iperf_set_test_zerocopy(self._test, 0)
             self._zerocopy = False
 
+    @property
+    def socket_bufsize(self):
+        """The socket buffer (TCP window) size in bytes, 0 for the OS default
+
+        :rtype: int
+        """
+        return self._require("iperf_get_test_socket_bufsize")(self._test)
+
+    @socket_bufsize.setter
+    def socket_bufsize(self, size):
+        if size < 0:
+            raise ValueError("socket_bufsize can't be negative")
+        self._require("iperf_set_test_socket_bufsize")(self._test, int(size))
+
+    @property
+    def mss(self):
+        """The TCP maximum segment size in bytes, 0 for the OS default
+
+        The MSS actually used is reported as :attr:`TestResult.tcp_mss`.
+
+        :rtype: int
+        """
+        return self._require("iperf_get_test_mss")(self._test)
+
+    @mss.setter
+    def mss(self, mss):
+        if mss < 0:
+            raise ValueError("mss can't be negative")
+        self._require("iperf_set_test_mss")(self._test, int(mss))
+
+    @property
+    def no_delay(self):
+        """Toggles TCP_NODELAY, disabling Nagle's algorithm
+
+        :rtype: bool
+        """
+        return bool(self._require("iperf_get_test_no_delay")(self._test))
+
+    @no_delay.setter
+    def no_delay(self, enabled):
+        self._require("iperf_set_test_no_delay")(self._test, 1 if enabled else 0)
+
+    @property
+    def congestion_control(self):
+        """The TCP congestion control algorithm, e.g. 'cubic' or 'bbr'
+
+        None uses the system default. Only supported on Linux and FreeBSD.
+        The algorithms actually used are reported as
+        :attr:`TestResult.sender_tcp_congestion` and
+        :attr:`TestResult.receiver_tcp_congestion`.
+
+        :rtype: string
+        """
+        result = self._require("iperf_get_test_congestion_control")(self._test)
+        if result:
+            return result.decode("utf-8")
+        return None
+
+    @congestion_control.setter
+    def congestion_control(self, algorithm):
+        setter = self._require("iperf_set_test_congestion_control")
+        # Keep a reference, libiperf may hold on to the pointer
+        self._congestion_control = c_char_p(algorithm.encode("utf-8"))
+        setter(self._test, self._congestion_control)
+
     @property
     def reverse(self):
         """Toggles direction of test
@@ -219,29 +434,274 @@ class Client(IPerf3):
 
         self._reverse = enabled
 
-    def run(self):
+    @property
+    def bidirectional(self):
+        """Toggles a bidirectional test (iperf >= 3.7)
+
+        Data is sent in both directions at the same time. The reverse
+        direction is reported separately in :class:`TestResult`, e.g. as
+        ``bidir_reverse_received_bps``.
+
+        :rtype: bool
+        """
+        return bool(self._require("iperf_get_test_bidirectional")(self._test))
+
+    @bidirectional.setter
+    def bidirectional(self, enabled):
+        self._require("iperf_set_test_bidirectional")(self._test, 1 if enabled else 0)
+        self._bidirectional = bool(enabled)
+
+    @property
+    def convergence(self):
+        """Policy ending the test early once the throughput has converged
+
+        An instance of :class:`iperf.iperf3.convergence.ConvergencePolicy`
+        fed with every interval of the test, None runs the full test.
+        The test is ended with :meth:`finish` and the stop reason is
+        reported as :attr:`TestResult.stop_reason`. Requires json output,
+        libraries without json stream support (iperf < 3.17) only report
+        the intervals once the test has finished and always run the full
+        test, as do tests :meth:`finish` can't end.
+
+        :rtype: instance of ConvergencePolicy or None
+        """
+        return self._convergence
+
+    @convergence.setter
+    def convergence(self, policy):
+        self._convergence = policy
+
+    def finish(self):
+        """End a test running in another thread early, keeping its results
+
+        Unlike :meth:`stop` the test ends the way it does once its byte
+        limit is reached, so the server still reports its side and a
+        complete :class:`TestResult` is returned. A 1 byte :attr:`num_bytes`
+        limit is set for that and restored once :meth:`run` returns. Older
+        libiperf versions only check it on the sending side, i.e. not for
+        reverse tests.
+
+        :rtype: bool, False when the loaded libiperf can't end the test
+        """
+        if not (
+            hasattr(self.lib, "iperf_get_test_bytes")
+            and hasattr(self.lib, "iperf_set_test_bytes")
+        ):
+            return False
+
+        if self._num_bytes_limit is None:
+            self._num_bytes_limit = self.num_bytes
+        self.num_bytes = 1
+        return True
+
+    def _reset_test(self):
+        """Reset the libiperf test so it can run again, keeping its settings"""
+        super(Client, self)._reset_test()
+        self._dirty = False
+
+    @property
+    def json_stream(self):
+        """Toggles libiperf's json stream output (iperf >= 3.17)
+
+        In stream mode every interval is emitted as soon as it is measured
+        instead of as part of a single document at the end of the test.
+        Always False when the library does not support it.
+
+        :rtype: bool
+        """
+        if not hasattr(self.lib, "iperf_get_test_json_stream"):
+            return False
+        return bool(self.lib.iperf_get_test_json_stream(self._test))
+
+    @json_stream.setter
+    def json_stream(self, enabled):
+        if hasattr(self.lib, "iperf_set_test_json_stream"):
+            self.lib.iperf_set_test_json_stream(self._test, 1 if enabled else 0)
+
+    def run(self, on_interval=None):
         """Run the current test client.
 
+        Can be called repeatedly, the libiperf test is reset in between
+        while keeping the configuration.
+
+        :param on_interval: optional callable receiving each interval dict
+            (with the libiperf ``streams`` and ``sum`` keys) while the test
+            is running. Libraries without json stream support only report
+            the intervals once the test has finished.
         :rtype: instance of :class:`TestResult`
         """
-        if self.json_output:
-            output_to_pipe(self._pipe_in)  # Disable stdout
-            error = self.lib.iperf_run_client(self._test)
+        self._ensure_open()
+        if self._dirty:
+            self._reset_test()
+
+        if self._bidirectional and self.reverse:
+            raise ValueError("A test can't be both reverse and bidirectional")
+        bounded = hasattr(self.lib, "iperf_get_test_bytes") and hasattr(
+            self.lib, "iperf_get_test_blocks"
+        )
+        if bounded and self.num_bytes and self.num_blocks:
+            raise ValueError("num_bytes and num_blocks are mutually exclusive")
+        bounded = bounded and bool(self.num_bytes or self.num_blocks)
 
-            if not self.iperf_version.startswith("iperf 3.1"):
-                data = read_pipe(self._pipe_out)
-                if data.startswith("Control connection"):
-                    data = "{" + data.split("{", 1)[1]
+        if self.json_output:
+            self._dirty = True
+
+            # Without json stream the intervals only arrive once the test
+            # has finished, too late to end it
+            can_stream = hasattr(self.lib, "iperf_set_test_json_stream")
+            stopped = []
+            if self._convergence is not None and can_stream:
+                on_interval = self._converging(on_interval, stopped)
+
+            parser = JsonStreamParser(on_interval)
+            streaming = on_interval is not None and can_stream
+            if streaming:
+                self.json_stream = True
+
+            # Like iperf3 -n/-k, a byte or block limit replaces the duration
+            duration = self.duration
+            if bounded:
+                self.duration = 0
+
+            try:
+                error, data = self._run_captured(
+                    self.lib.iperf_run_client,
+                    on_data=parser.feed if on_interval else None,
+                )
+            finally:
+                if streaming:
+                    self.json_stream = False
+                if bounded:
+                    self.duration = duration
+                if self._num_bytes_limit is not None:
+                    self.num_bytes = self._num_bytes_limit
+                    self._num_bytes_limit = None
+
+            if streaming:
+                data = parser.document
             else:
-                data = c_char_p(
-                    self.lib.iperf_get_test_json_output_string(self._test)
-                ).value
-                if data:
-                    data = data.decode("utf-8")
+                data = self._json_output_string() or data
 
-            output_to_screen(self._stdout_fd, self._stderr_fd)  # enable stdout
+            data = extract_json(data)
 
             if not data or error:
                 data = '{"error": "%s"}' % self._error_to_string(self._errno)
 
-            return TestResult(data)
+            result = TestResult(data)
+            if not result.error:
+                changed = self._report_settings(result)
+                if stopped:
+                    result.json["stop_reason"] = result.stop_reason = stopped[0]
+                    changed = True
+                if changed:
+                    result.text = json.dumps(result.json)
+            return result
+
+    def _converging(self, on_interval, stopped):
+        """Wrap the interval callback to feed the convergence policy
+
+        :param stopped: list receiving the stop reason once converged and
+            the test was ended
+        :rtype: the interval callback to use for the test
+        """
+        policy = self._convergence
+        policy.reset()
+        converged = []
+
+        def _on_interval(interval):
+            if on_interval is not None:
+                on_interval(interval)
+            if converged:
+                return
+            reason = policy.update(interval)
+            if not reason:
+                return
+
+            converged.append(reason)
+            try:
+                if self.finish():
+                    stopped.append(reason)
+            except Exception:
+                # Called from the capture thread, the test runs in full
+                pass
+
+        return _on_interval
+
+    def _report_settings(self, result):
+        """Fill in the settings libiperf leaves out of the result
+
+        They are added to ``start.test_start`` of the json, under the keys
+        :class:`TestResult` reads them from, so they survive the result
+        text.
+
+        :rtype: bool, True if the json was changed
+        """
+        test_start = result.json["start"]["test_start"]
+        changed = False
+        for name, key in (
+            ("reporter_interval", "interval"),
+            ("fqrate", "fqrate"),
+            ("pacing_timer", "pacing_timer"),
+            ("burst", "burst"),
+        ):
+            if getattr(result, name) is None:
+                try:
+                    value = getattr(self, name)
+                except NotImplementedError:
+                    continue
+                setattr(result, name, value)
+                test_start[key] = value
+                changed = True
+        return changed
+
+    def run_stream(self):
+        """Run the current test client, yielding intervals as they arrive.
+
+        Each yielded item is an interval dict with the libiperf ``streams``
+        and ``sum`` keys. The :class:`TestResult` of the test is the return
+        value of the generator. Leaving the iteration early stops the test.
+
+        Basic Usage::
+
+          >>> for interval in client.run_stream():
+          ...     print(interval['sum']['bits_per_second'])
+
+        :rtype: generator
+        """
+        done = object()
+        intervals = Queue()
+        outcome = {}
+
+        def _run_in_thread():
+            try:
+                outcome["result"] = self.run(on_interval=intervals.put)
+            except Exception as e:
+                outcome["error"] = e
+            finally:
+                intervals.put(done)
+
+        t = threading.Thread(target=_run_in_thread)
+        t.daemon = True
+        t.start()
+
+        finished = False
+        try:
+            while True:
+                interval = intervals.get()
+                if interval is done:
+                    finished = True
+                    break
+                yield interval
+        finally:
+            # Leaving the iteration early stops the test, so it doesn't keep
+            # running on the libiperf test a later run would reuse. stop()
+            # does nothing until the control connection is up, retry it.
+            while not finished and t.is_alive():
+                self.stop()
+                t.join(0.1)
+
+        t.join()
+
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome["result"]
@@ -0,0 +1,148 @@
+import math
+from collections import deque
+from statistics import NormalDist, mean, stdev
+
+
+def _t_quantile(p, df):
+    """Student's t quantile, Cornish-Fisher expansion of the normal one
+
+    Exact for 1 and 2 degrees of freedom, where the expansion is poor.
+    """
+    if df == 1:
+        return math.tan(math.pi * (p - 0.5))
+    if df == 2:
+        return (2 * p - 1) / math.sqrt(2 * p * (1 - p))
+
+    z = NormalDist().inv_cdf(p)
+    return (
+        z
+        + (z**3 + z) / (4 * df)
+        + (5 * z**5 + 16 * z**3 + 3 * z) / (96 * df**2)
+        + (3 * z**7 + 19 * z**5 + 17 * z**3 - 15 * z) / (384 * df**3)
+    )
+
+
+class ConvergencePolicy(object):
+    """Base class of the policies ending a :class:`Client` test early.
+
+    The policy is fed the throughput of every interval and decides once
+    the last ``window`` intervals have converged. Omitted intervals are
+    ignored. Subclasses implement :meth:`check`.
+
+    A policy keeps the state of a single running test, don't share one
+    between clients running concurrently.
+    """
+
+    def __init__(self, window=5):
+        """Initialise the policy
+
+        :param window: number of most recent intervals considered
+        """
+        if window < 2:
+            raise ValueError("window has to span at least 2 intervals")
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        """Forget the intervals of the previous test"""
+        self._values = deque(maxlen=self.window)
+
+    def update(self, interval):
+        """Feed the next interval of the running test
+
+        :param interval: interval dict with the libiperf ``sum`` key
+        :rtype: the stop reason once converged, None otherwise
+        """
+        summary = interval.get("sum") or {}
+        bps = summary.get("bits_per_second")
+        if summary.get("omitted") or bps is None:
+            return None
+
+        self._values.append(bps)
+        if len(self._values) < self.window:
+            return None
+        return self.check(list(self._values))
+
+    def check(self, values):
+        """Decide whether the test has converged
+
+        :param values: throughput of the last ``window`` intervals in
+            bits/sec, oldest first
+        :rtype: the stop reason once converged, None otherwise
+        """
+        raise NotImplementedError
+
+
+class CoefficientOfVariation(ConvergencePolicy):
+    """Converged once the relative standard deviation of the window is low
+
+    Basic Usage::
+
+      >>> from iperf.iperf3.convergence import CoefficientOfVariation
+
+      >>> client.convergence = CoefficientOfVariation(window=5, threshold=0.02)
+      >>> result = client.run()
+      >>> result.stop_reason
+      'coefficient of variation 0.013 of the last 5 intervals below 0.02'
+    """
+
+    def __init__(self, window=5, threshold=0.05):
+        """Initialise the policy
+
+        :param window: number of most recent intervals considered
+        :param threshold: highest coefficient of variation, the standard
+            deviation divided by the mean, considered converged
+        """
+        super(CoefficientOfVariation, self).__init__(window)
+        self.threshold = threshold
+
+    def check(self, values):
+        average = mean(values)
+        if average <= 0:
+            return None
+
+        cv = stdev(values) / average
+        if cv >= self.threshold:
+            return None
+
+        reason = "coefficient of variation {:.3g} of the last {} intervals below {}"
+        return reason.format(cv, self.window, self.threshold)
+
+
+class ConfidenceInterval(ConvergencePolicy):
+    """Converged once the confidence interval of the mean throughput is narrow
+
+    Basic Usage::
+
+      >>> from iperf.iperf3.convergence import ConfidenceInterval
+
+      >>> client.convergence = ConfidenceInterval(window=10, width=0.05)
+      >>> result = client.run()
+    """
+
+    def __init__(self, window=10, width=0.05, confidence=0.95):
+        """Initialise the policy
+
+        :param window: number of most recent intervals considered
+        :param width: widest confidence interval considered converged,
+            relative to the mean throughput
+        :param confidence: confidence level of the interval
+        """
+        super(ConfidenceInterval, self).__init__(window)
+        if not 0 < confidence < 1:
+            raise ValueError("confidence has to be between 0 and 1")
+        self.width = width
+        self.confidence = confidence
+        self._t = _t_quantile((1 + confidence) / 2, window - 1)
+
+    def check(self, values):
+        average = mean(values)
+        if average <= 0:
+            return None
+
+        width = 2 * self._t * stdev(values) / math.sqrt(len(values)) / average
+        if width >= self.width:
+            return None
+
+        reason = "{:g}% confidence interval {:.3g} of the last {} intervals below {}"
+        return reason.format(self.confidence * 100, width, self.window, self.width)
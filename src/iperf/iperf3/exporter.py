@@ -0,0 +1,307 @@
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# Gauges of the latest result per target as (metric, help, TestResult
+# attribute, scale to base units). Attributes a result doesn't report for
+# its protocol are left out.
+SUMMARY_METRICS = (
+    ("iperf3_sent_bits_per_second", "TCP throughput of the sender", "sent_bps", 1),
+    (
+        "iperf3_received_bits_per_second",
+        "TCP throughput of the receiver",
+        "received_bps",
+        1,
+    ),
+    ("iperf3_retransmits", "TCP retransmits of the sender", "retransmits", 1),
+    ("iperf3_udp_bits_per_second", "UDP throughput", "bps", 1),
+    ("iperf3_jitter_seconds", "UDP jitter", "jitter_ms", 1e-3),
+    ("iperf3_loss_ratio", "UDP packet loss", "lost_percent", 1e-2),
+    ("iperf3_local_cpu_ratio", "Local CPU utilization", "local_cpu_total", 1e-2),
+    ("iperf3_remote_cpu_ratio", "Remote CPU utilization", "remote_cpu_total", 1e-2),
+    ("iperf3_test_timestamp_seconds", "Start time of the test", "timesecs", 1),
+)
+
+# Upper bounds of the interval throughput histogram buckets in bits/sec
+DEFAULT_BUCKETS = (1e6, 1e7, 1e8, 1e9, 2.5e9, 5e9, 1e10, 2.5e10, 4e10, 1e11)
+
+
+def _escape(value):
+    """Escape a label value"""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value):
+    """Format a sample value"""
+    if value != value:
+        return "NaN"
+    if value in (float("inf"), float("-inf")):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Target(object):
+    """The metrics kept for a single target"""
+
+    __slots__ = ("summary", "live", "tests", "errors", "buckets", "count", "sum")
+
+    def __init__(self, num_buckets):
+        self.summary = {}
+        self.live = None
+        self.tests = 0
+        self.errors = 0
+        self.buckets = [0] * num_buckets
+        self.count = 0
+        self.sum = 0.0
+
+
+class MetricsRegistry(object):
+    """In-memory registry of the latest test results per target.
+
+    Only the summary values and interval histogram counts are kept, never
+    the result documents, and the rendered exposition is cached until the
+    next update, so scrapes don't allocate per result.
+
+    Basic Usage::
+
+      >>> from iperf.iperf3.exporter import MetricsRegistry, MetricsServer
+
+      >>> registry = MetricsRegistry()
+      >>> with MetricsServer(registry, port=9230):
+      ...     while True:
+      ...         registry.observe(client.run())
+
+    It can also be fed by a :class:`ServerPool`::
+
+      >>> pool = ServerPool(range(5201, 5211), callback=registry.observe)
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """Initialise the registry
+
+        :param buckets: ascending upper bounds in bits/sec of the interval
+            throughput histogram, +Inf is added automatically
+        """
+        self.buckets = tuple(sorted(buckets))
+        self._targets = {}
+        self._lock = threading.Lock()
+        self._cache = None
+
+    @staticmethod
+    def _target_of(result):
+        return "{}:{}".format(result.remote_host, result.remote_port)
+
+    def _get(self, target):
+        entry = self._targets.get(target)
+        if entry is None:
+            entry = self._targets[target] = _Target(len(self.buckets) + 1)
+        return entry
+
+    def observe(self, result, target=None):
+        """Record a finished test
+
+        :param result: instance of :class:`TestResult`
+        :param target: optional target label, defaults to
+            ``remote_host:remote_port``, required for error results
+        :raises ValueError: for error results without a target
+        """
+        if target is None:
+            if result.error:
+                raise ValueError("error results need an explicit target")
+            target = self._target_of(result)
+
+        summary = {}
+        bps = []
+        if not result.error:
+            summary = dict(
+                (metric, getattr(result, attr) * scale)
+                for metric, _, attr, scale in SUMMARY_METRICS
+                if getattr(result, attr, None) is not None
+            )
+            for interval in (getattr(result, "json", None) or {}).get("intervals", []):
+                value = interval.get("sum", {}).get("bits_per_second")
+                if value is not None:
+                    bps.append(value)
+
+        with self._lock:
+            entry = self._get(target)
+            # the test the live gauge followed has finished
+            entry.live = None
+            entry.tests += 1
+            if result.error:
+                entry.errors += 1
+            else:
+                entry.summary = summary
+            for value in bps:
+                entry.buckets[bisect.bisect_left(self.buckets, value)] += 1
+                entry.sum += value
+            entry.count += len(bps)
+            self._cache = None
+
+    def interval_callback(self, target):
+        """A :meth:`Client.run` ``on_interval`` callback for a live gauge
+
+        :param target: The target label
+        :rtype: callable receiving the interval dicts of a running test
+        """
+
+        def _on_interval(interval):
+            value = interval.get("sum", {}).get("bits_per_second")
+            with self._lock:
+                self._get(target).live = value
+                self._cache = None
+
+        return _on_interval
+
+    def remove(self, target):
+        """Forget a target"""
+        with self._lock:
+            self._targets.pop(target, None)
+            self._cache = None
+
+    def render(self):
+        """The registry in OpenMetrics text format
+
+        :rtype: bytes
+        """
+        with self._lock:
+            if self._cache is None:
+                self._cache = self._render().encode("utf-8")
+            return self._cache
+
+    def _render(self):
+        targets = [
+            (_escape(target), self._targets[target]) for target in sorted(self._targets)
+        ]
+        recorded = [(target, entry) for target, entry in targets if entry.tests]
+        lines = []
+
+        for metric, help_text, _, _ in SUMMARY_METRICS:
+            lines.append("# TYPE {} gauge".format(metric))
+            lines.append("# HELP {} {}".format(metric, help_text))
+            for target, entry in targets:
+                value = entry.summary.get(metric)
+                if value is not None:
+                    lines.append(
+                        '{}{{target="{}"}} {}'.format(metric, target, _number(value))
+                    )
+
+        lines.append("# TYPE iperf3_live_bits_per_second gauge")
+        lines.append(
+            "# HELP iperf3_live_bits_per_second Throughput of the last interval "
+            "of a running test"
+        )
+        for target, entry in targets:
+            if entry.live is not None:
+                lines.append(
+                    'iperf3_live_bits_per_second{{target="{}"}} {}'.format(
+                        target, _number(entry.live)
+                    )
+                )
+
+        for metric, help_text, attr in (
+            ("iperf3_tests", "Tests recorded", "tests"),
+            ("iperf3_test_errors", "Tests that failed", "errors"),
+        ):
+            lines.append("# TYPE {} counter".format(metric))
+            lines.append("# HELP {} {}".format(metric, help_text))
+            for target, entry in recorded:
+                lines.append(
+                    '{}_total{{target="{}"}} {}'.format(
+                        metric, target, getattr(entry, attr)
+                    )
+                )
+
+        metric = "iperf3_interval_bits_per_second"
+        lines.append("# TYPE {} histogram".format(metric))
+        lines.append("# HELP {} Throughput of the test intervals".format(metric))
+        bounds = [_number(bound) for bound in self.buckets] + ["+Inf"]
+        for target, entry in recorded:
+            cumulative = 0
+            for bound, count in zip(bounds, entry.buckets):
+                cumulative += count
+                lines.append(
+                    '{}_bucket{{target="{}",le="{}"}} {}'.format(
+                        metric, target, bound, cumulative
+                    )
+                )
+            lines.append(
+                '{}_count{{target="{}"}} {}'.format(metric, target, entry.count)
+            )
+            lines.append(
+                '{}_sum{{target="{}"}} {}'.format(metric, target, _number(entry.sum))
+            )
+
+        lines.append("# EOF\n")
+        return "\n".join(lines)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Serves the registry of the server on /metrics"""
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+
+        body = self.server.registry.render()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer(object):
+    """HTTP endpoint serving a :class:`MetricsRegistry` on ``/metrics``
+
+    Runs in a background thread, by default only reachable from the
+    local host.
+    """
+
+    def __init__(self, registry, port=9230, address="127.0.0.1"):
+        """Initialise the server
+
+        :param registry: instance of :class:`MetricsRegistry`
+        :param port: The port to listen on, 0 picks a free one
+        :param address: The address to listen on
+        """
+        self.registry = registry
+        self._httpd = ThreadingHTTPServer((address, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.registry = registry
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def port(self):
+        """The port the server listens on
+
+        :rtype: int
+        """
+        return self._httpd.server_address[1]
+
+    def start(self):
+        """Start serving in a background thread"""
+        self._thread = threading.Thread(target=self._httpd.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop serving and close the listening socket"""
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._httpd.server_close()
@@ -0,0 +1,239 @@
+import json
+import multiprocessing
+import os
+import threading
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from iperf.iperf3._iperf3 import preload
+from iperf.iperf3.client import Client
+from iperf.iperf3.test_result import TestResult
+
+
+class Job(namedtuple("Job", ["server_hostname", "port", "settings"])):
+    """A single client test run by :class:`Fleet`
+
+    :param server_hostname: The server hostname to connect to
+    :param port: The port the iperf3 server is listening on
+    :param settings: optional dict of :class:`Client` properties,
+        e.g. ``{'duration': 5, 'protocol': 'udp'}``
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, server_hostname, port=5201, settings=None):
+        return super(Job, cls).__new__(cls, server_hostname, port, settings or {})
+
+
+def _error(message):
+    """A json error document as produced by :class:`Client`"""
+    return json.dumps({"error": message})
+
+
+def _init_worker(lib_name, cores=None):
+    """Pool initializer, loads libiperf once per worker process
+
+    :param cores: optional queue of cpu cores, the worker takes one and
+        pins itself and the test threads it starts to it
+    """
+    if cores is not None:
+        os.sched_setaffinity(0, {cores.get()})
+
+    try:
+        preload(lib_name)
+    except OSError:
+        # Reported per job by _run_job
+        pass
+
+
+# Timed out tests still running in this worker process as (thread, client)
+_stale = []
+
+
+def _wait_stale():
+    """Wait for the timed out tests of this worker to end
+
+    libiperf keeps process wide state, so a new test can't run next to a
+    test that is still blocked, e.g. in connect.
+    """
+    while _stale:
+        t, client = _stale.pop()
+        t.join()
+        client.close()
+
+
+def _run_job(job, timeout, lib_name):
+    """Run a single job inside a worker process
+
+    :rtype: the raw json result text
+    """
+    _wait_stale()
+
+    try:
+        client = Client(lib_name=lib_name)
+    except OSError as e:
+        return _error(str(e))
+
+    client.server_hostname = job.server_hostname
+    client.port = job.port
+    if timeout is not None:
+        # A test still connecting can't be stopped, bound the connect so a
+        # timed out test doesn't hold up the worker's next job for long
+        try:
+            client.connect_timeout = timeout
+        except NotImplementedError:
+            pass
+    for name, value in job.settings.items():
+        if not isinstance(getattr(Client, name, None), property):
+            client.close()
+            return _error("Unknown client setting {}".format(name))
+        setattr(client, name, value)
+
+    outcome = {}
+
+    def _run_in_thread():
+        try:
+            outcome["result"] = client.run()
+        except Exception as e:
+            outcome["error"] = e
+
+    t = threading.Thread(target=_run_in_thread)
+    t.daemon = True
+    t.start()
+    t.join(timeout)
+
+    if t.is_alive():
+        client.stop()
+        t.join(1)
+        if t.is_alive():
+            # Without a control connection yet the test can't be stopped
+            _stale.append((t, client))
+        else:
+            client.close()
+        return _error("test timed out after {} seconds".format(timeout))
+
+    client.close()
+    if "error" in outcome:
+        return _error(str(outcome["error"]))
+    if outcome["result"] is None:
+        return _error("json_output has to be enabled for fleet tests")
+    return outcome["result"].text
+
+
+class Fleet(object):
+    """Runs client tests against many servers on a pool of processes.
+
+    Every job runs in a worker process with its own libiperf test, so
+    jobs never share native state. The pool is kept alive between calls to
+    :meth:`run` and can be reused for periodic probing.
+
+    Basic Usage::
+
+      >>> from iperf.iperf3.fleet import Fleet
+
+      >>> jobs = [('10.0.0.1', 5201, {'duration': 5}), ('10.0.0.2', 5201)]
+      >>> with Fleet(max_workers=8, timeout=30) as fleet:
+      ...     for job, result in fleet.run(jobs):
+      ...         print(job.server_hostname, result.sent_Mbps)
+    """
+
+    def __init__(self, max_workers=None, timeout=None, lib_name=None, cores=None):
+        """Initialise the worker pool
+
+        :param max_workers: maximum number of tests running concurrently,
+            defaults to the number of cores or CPUs
+        :param timeout: optional per job timeout in seconds, a job exceeding
+            it is interrupted and reported as an error result. It also
+            bounds the connect to the server (iperf >= 3.8), a test that
+            can't be interrupted yet because it is still connecting holds
+            up the worker's next job until the connect fails
+        :param lib_name: optional name and path for libiperf.so.0 library
+        :param cores: optional list of distinct cpu cores, every worker
+            process is pinned to one of them, see
+            :func:`iperf.iperf3.placement.plan_cores`
+        """
+        self.timeout = timeout
+        self.lib_name = lib_name
+        self.cores = list(cores) if cores is not None else None
+        self.max_workers = max_workers or len(self.cores or ()) or os.cpu_count() or 1
+
+        queue = None
+        if self.cores is not None:
+            if len(self.cores) < self.max_workers:
+                raise ValueError("cores needs a cpu core for every worker")
+            queue = multiprocessing.Queue()
+            for core in self.cores:
+                queue.put(core)
+
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            initializer=_init_worker,
+            initargs=(lib_name, queue),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Shut down the worker processes"""
+        self._executor.shutdown(wait=True)
+
+    def _submit(self, job):
+        return self._executor.submit(_run_job, job, self.timeout, self.lib_name)
+
+    def run(self, jobs, ordered=True):
+        """Run the jobs, yielding ``(job, TestResult)`` pairs
+
+        At most twice ``max_workers`` jobs are queued on the pool at any
+        time, so arbitrarily long job iterables are consumed lazily.
+
+        :param jobs: iterable of :class:`Job` or
+            ``(server_hostname, port, settings)`` tuples
+        :param ordered: yield results in job order when True, as they
+            complete otherwise
+        :rtype: generator
+        """
+        jobs = (job if isinstance(job, Job) else Job(*job) for job in jobs)
+        window = 2 * self.max_workers
+        pending = deque()
+
+        for job in jobs:
+            pending.append((job, self._submit(job)))
+            if len(pending) >= window:
+                for item in self._collect(pending, ordered):
+                    yield item
+
+        while pending:
+            for item in self._collect(pending, ordered):
+                yield item
+
+    def _collect(self, pending, ordered):
+        """Remove and yield finished jobs from the pending queue"""
+        if ordered:
+            job, future = pending.popleft()
+            yield job, self._result(future)
+            return
+
+        done, _ = wait([future for _, future in pending], return_when=FIRST_COMPLETED)
+        for item in [item for item in pending if item[1] in done]:
+            pending.remove(item)
+            yield item[0], self._result(item[1])
+
+    def _result(self, future):
+        try:
+            return TestResult(future.result())
+        except Exception as e:
+            return TestResult(_error(str(e)))
+
+
+def run_fleet(jobs, max_workers=None, timeout=None, ordered=True, lib_name=None):
+    """Run the jobs on a temporary :class:`Fleet`
+
+    :rtype: generator of ``(job, TestResult)`` pairs
+    """
+    with Fleet(max_workers=max_workers, timeout=timeout, lib_name=lib_name) as fleet:
+        for item in fleet.run(jobs, ordered=ordered):
+            yield item
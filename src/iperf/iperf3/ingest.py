@@ -0,0 +1,207 @@
+import glob
+import json
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from iperf.iperf3.test_result import SUMMARY_FIELDS, CompactTestResult, parse_summary
+
+# A line starting a top level document, pretty printed or newline delimited
+_DOCUMENT_START = re.compile(r"^\{", re.MULTILINE)
+
+
+def iter_paths(source):
+    """Expand a source into iperf3 json file paths
+
+    :param source: a directory (searched recursively for ``*.json``,
+        ``*.jsonl`` and ``*.log`` files), a glob pattern, a file path or an
+        iterable of those
+    :rtype: generator of paths
+    """
+    if not isinstance(source, (str, bytes, os.PathLike)):
+        for item in source:
+            for path in iter_paths(item):
+                yield path
+        return
+
+    source = os.fspath(source)
+    if os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if name.endswith((".json", ".jsonl", ".log")):
+                    yield os.path.join(root, name)
+    elif os.path.isfile(source):
+        yield source
+    else:
+        for path in sorted(glob.glob(source, recursive=True)):
+            if os.path.isfile(path):
+                yield path
+
+
+def iter_documents(text):
+    """Split file contents into json document texts
+
+    Handles a single (pretty printed) document as well as newline
+    delimited logs. Undecodable parts are reported as errors and skipped
+    up to the next line starting with ``{``, so the nested objects of a
+    truncated pretty printed document aren't taken for documents.
+
+    :param text: The file contents
+    :rtype: generator of ``(document_text, error)`` pairs, one is None
+    """
+    decoder = json.JSONDecoder()
+    position = 0
+    length = len(text)
+
+    while position < length:
+        start = text.find("{", position)
+        if start < 0:
+            break
+
+        try:
+            _, end = decoder.raw_decode(text, start)
+        except ValueError as e:
+            yield None, str(e)
+            match = _DOCUMENT_START.search(text, start + 1)
+            if match is None:
+                break
+            position = match.start()
+            continue
+
+        yield text[start:end], None
+        position = end
+
+
+def _parse_chunk(paths, columnar, result_class, keep_text=False):
+    """Parse a chunk of files inside a worker process
+
+    :rtype: tuple of the results (or columns) and a list of
+        ``(path, error)`` pairs
+    """
+    results = []
+    columns = dict((name, []) for name in SUMMARY_FIELDS)
+    errors = []
+
+    for path in paths:
+        try:
+            with open(path, encoding="utf-8") as f:
+                text = f.read()
+        except (OSError, ValueError) as e:
+            errors.append((path, str(e)))
+            continue
+
+        for document, error in iter_documents(text):
+            if error is not None:
+                errors.append((path, error))
+                continue
+
+            try:
+                if columnar:
+                    summary = parse_summary(json.loads(document))
+                else:
+                    result = result_class(document)
+                    summary = {"error": result.error}
+            except (ValueError, KeyError, IndexError, TypeError) as e:
+                errors.append((path, "malformed result: {!r}".format(e)))
+                continue
+
+            if summary["error"]:
+                errors.append((path, summary["error"]))
+            elif columnar:
+                for name in SUMMARY_FIELDS:
+                    columns[name].append(summary.get(name))
+            else:
+                if not keep_text and hasattr(result, "drop_text"):
+                    result.drop_text()
+                results.append(result)
+
+    return (columns if columnar else results), errors
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def ingest(
+    source,
+    workers=None,
+    chunksize=64,
+    columnar=False,
+    result_class=CompactTestResult,
+    on_error=None,
+    keep_text=False,
+):
+    """Parse stored iperf3 json results in parallel
+
+    Files are parsed in chunks on a process pool, with at most twice
+    ``workers`` chunks in flight so memory stays bounded however many files
+    are ingested. Malformed documents and error results are skipped.
+
+    Results are sent back from the workers pickled, which costs about a
+    third of parsing them for a :class:`TestResult` holding its text and
+    decoded json. By default :class:`CompactTestResult` summaries without
+    the text are sent instead, pass ``keep_text=True`` or
+    ``result_class=TestResult`` when the full documents are needed.
+
+    Basic Usage::
+
+      >>> from iperf.iperf3.ingest import ingest
+
+      >>> for result in ingest('/var/log/iperf3/'):
+      ...     print(result.remote_host, result.sent_Mbps)
+
+    :param source: see :func:`iter_paths`
+    :param workers: number of worker processes, defaults to the number of
+        CPUs. 0 parses in the calling process
+    :param chunksize: number of files parsed per worker task
+    :param columnar: yield one dict of summary columns (lists keyed by
+        the :class:`TestResult` attribute names) per chunk instead of
+        result objects
+    :param result_class: class used to build results, e.g.
+        :class:`TestResult`
+    :param on_error: optional callable receiving ``(path, error)`` for
+        every skipped document
+    :param keep_text: keep the raw json text of :class:`CompactTestResult`
+        results
+    :rtype: generator of results, or of column dicts when columnar
+    """
+    chunks = _chunks(iter_paths(source), chunksize)
+
+    def _emit(outcome):
+        output, errors = outcome
+        if on_error is not None:
+            for path, error in errors:
+                on_error(path, error)
+        if columnar:
+            # Skip batches without a single valid row
+            return [output] if output["error"] else []
+        return output
+
+    if workers == 0:
+        for chunk in chunks:
+            for item in _emit(_parse_chunk(chunk, columnar, result_class, keep_text)):
+                yield item
+        return
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(
+                executor.submit(_parse_chunk, chunk, columnar, result_class, keep_text)
+            )
+            if len(pending) >= 2 * workers:
+                for item in _emit(pending.popleft().result()):
+                    yield item
+
+        while pending:
+            for item in _emit(pending.popleft().result()):
+                yield item
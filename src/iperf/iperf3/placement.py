@@ -0,0 +1,168 @@
+import glob
+import os
+import re
+
+
+def parse_cpulist(text):
+    """Parse a kernel cpu list such as ``0-3,8,10-11``
+
+    :param text: The cpu list as found in sysfs and procfs
+    :rtype: sorted list of int
+    """
+    cpus = set()
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return sorted(cpus)
+
+
+def _read(path):
+    """The stripped content of a sysfs/procfs file, None if unreadable"""
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except (IOError, OSError):
+        return None
+
+
+def _usable_cpus():
+    """The cpus this process may run on"""
+    if hasattr(os, "sched_getaffinity"):
+        return os.sched_getaffinity(0)
+    return set(range(os.cpu_count() or 1))
+
+
+def numa_nodes(sysfs="/sys"):
+    """The cpus of every NUMA node
+
+    Systems without NUMA information are reported as a single node 0
+    holding all cpus.
+
+    :param sysfs: The sysfs mount point
+    :rtype: dict of node id and sorted list of cpus
+    """
+    nodes = {}
+    pattern = os.path.join(sysfs, "devices", "system", "node", "node*")
+    for path in glob.glob(pattern):
+        match = re.match(r"node(\d+)$", os.path.basename(path))
+        cpulist = _read(os.path.join(path, "cpulist"))
+        if match and cpulist is not None:
+            nodes[int(match.group(1))] = parse_cpulist(cpulist)
+
+    if not nodes:
+        nodes[0] = sorted(_usable_cpus())
+    return nodes
+
+
+def nic_numa_node(interface, sysfs="/sys"):
+    """The NUMA node a network interface is attached to
+
+    :param interface: The interface name, e.g. 'eth0'
+    :param sysfs: The sysfs mount point
+    :rtype: int, None for virtual interfaces or without NUMA information
+    """
+    node = _read(os.path.join(sysfs, "class", "net", interface, "device", "numa_node"))
+    if node is None or int(node) < 0:
+        return None
+    return int(node)
+
+
+def nic_local_cpus(interface, sysfs="/sys"):
+    """The cpus local to a network interface
+
+    :param interface: The interface name, e.g. 'eth0'
+    :param sysfs: The sysfs mount point
+    :rtype: sorted list of int, empty when unknown
+    """
+    device = os.path.join(sysfs, "class", "net", interface, "device")
+    cpulist = _read(os.path.join(device, "local_cpulist"))
+    if cpulist:
+        return parse_cpulist(cpulist)
+
+    node = nic_numa_node(interface, sysfs)
+    if node is None:
+        return []
+    return numa_nodes(sysfs).get(node, [])
+
+
+def nic_irq_cpus(interface, sysfs="/sys", procfs="/proc"):
+    """The cpus handling the interrupts of a network interface
+
+    The interrupts are the device's MSI vectors, or the lines of
+    ``/proc/interrupts`` naming the interface for devices without them.
+
+    :param interface: The interface name, e.g. 'eth0'
+    :param sysfs: The sysfs mount point
+    :param procfs: The procfs mount point
+    :rtype: sorted list of int
+    """
+    msi = os.path.join(sysfs, "class", "net", interface, "device", "msi_irqs")
+    try:
+        irqs = os.listdir(msi)
+    except OSError:
+        irqs = []
+        interrupts = _read(os.path.join(procfs, "interrupts")) or ""
+        for line in interrupts.splitlines():
+            irq, _, rest = line.partition(":")
+            if irq.strip().isdigit() and re.search(
+                r"\b{}\b".format(re.escape(interface)), rest
+            ):
+                irqs.append(irq.strip())
+
+    cpus = set()
+    for irq in irqs:
+        cpulist = _read(os.path.join(procfs, "irq", irq, "smp_affinity_list"))
+        if cpulist:
+            cpus.update(parse_cpulist(cpulist))
+    return sorted(cpus)
+
+
+def plan_cores(
+    count, interface=None, avoid_irq_cpus=True, sysfs="/sys", procfs="/proc"
+):
+    """Pick a distinct cpu core for each of ``count`` parallel tests
+
+    Cores local to the interface's NUMA node come first, with the ones
+    handling its interrupts after the others, followed by the cores of
+    the remaining nodes. Cores are only reused once every usable core has
+    been handed out.
+
+    Basic Usage::
+
+      >>> from iperf.iperf3.placement import plan_cores
+
+      >>> cores = plan_cores(4, interface='eth0')
+      >>> with ServerPool(range(5201, 5205), affinity=cores) as pool:
+      ...     ...
+
+    :param count: The number of cores needed
+    :param interface: optional name of the interface the tests use
+    :param avoid_irq_cpus: rank the interface's interrupt cores last
+    :param sysfs: The sysfs mount point
+    :param procfs: The procfs mount point
+    :rtype: list of int
+    """
+    usable = _usable_cpus()
+    nodes = numa_nodes(sysfs)
+
+    local = nic_local_cpus(interface, sysfs) if interface else []
+    irq = set(nic_irq_cpus(interface, sysfs, procfs)) if interface else set()
+    if not avoid_irq_cpus:
+        irq = set()
+
+    ranked = [cpu for cpu in local if cpu not in irq]
+    ranked += [cpu for cpu in local if cpu in irq]
+    for node in sorted(nodes):
+        ranked += [cpu for cpu in nodes[node] if cpu not in local]
+
+    seen = set()
+    cores = []
+    for cpu in ranked:
+        if cpu in usable and cpu not in seen:
+            seen.add(cpu)
+            cores.append(cpu)
+    cores = cores or sorted(usable)
+
+    return [cores[i % len(cores)] for i in range(count)]
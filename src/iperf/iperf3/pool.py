@@ -0,0 +1,301 @@
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from queue import Queue
+
+from iperf.iperf3.client import Client
+from iperf.iperf3.server import Server
+from iperf.iperf3.test_result import TestResult
+
+logger = logging.getLogger(__name__)
+
+
+class ServerPool(object):
+    """A pool of iperf3 servers listening on a range of ports.
+
+    Every port is served by its own :class:`Server` running in a worker
+    thread, so as many tests as there are ports can run at the same time.
+    Each finished :class:`TestResult` is put on :attr:`results` and passed
+    to the optional callback.
+
+    Basic Usage::
+
+      >>> from iperf.iperf3 import ServerPool
+
+      >>> with ServerPool(range(5201, 5211)) as pool:
+      ...     while True:
+      ...         result = pool.results.get()
+      ...         print(result.remote_host, result.received_Mbps)
+    """
+
+    # Seconds to wait before restarting a server that failed, e.g. because
+    # its port is already in use
+    retry_delay = 1
+
+    def __init__(
+        self,
+        ports,
+        bind_address=None,
+        callback=None,
+        results=None,
+        lib_name=None,
+        verbose=False,
+        affinity=None,
+    ):
+        """Initialise the server pool
+
+        :param ports: iterable of ports to listen on, one server each
+        :param bind_address: optional address the servers listen on
+        :param callback: optional callable receiving each
+            :class:`TestResult`, called from the worker threads, its
+            exceptions are logged
+        :param results: optional queue to publish results on, a new
+            :class:`queue.Queue` is created by default
+        :param lib_name: optional name and path for libiperf.so.0 library
+        :param verbose: enable verbose output
+        :param affinity: optional iterable of cpu cores, the server of each
+            port is pinned to the core at the same position, see
+            :func:`iperf.iperf3.placement.plan_cores`
+        """
+        self.ports = list(ports)
+        self.bind_address = bind_address
+        self.callback = callback
+        self.results = results if results is not None else Queue()
+        self.lib_name = lib_name
+        self.verbose = verbose
+        self.affinity = list(affinity) if affinity is not None else None
+        if self.affinity is not None and len(self.affinity) < len(self.ports):
+            raise ValueError("affinity needs a cpu core for every port")
+
+        self._servers = []
+        self._threads = []
+        self._stopping = threading.Event()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def running(self):
+        """True while the pool is serving
+
+        :rtype: bool
+        """
+        return any(t.is_alive() for t in self._threads)
+
+    def start(self):
+        """Start a server on every port of the pool"""
+        if self.running:
+            raise RuntimeError("ServerPool is already running")
+
+        self._stopping.clear()
+        self._servers = []
+        self._threads = []
+
+        for i, port in enumerate(self.ports):
+            server = Server(verbose=self.verbose, lib_name=self.lib_name)
+            if self.bind_address is not None:
+                server.bind_address = self.bind_address
+            server.port = port
+            if self.affinity is not None:
+                server.affinity = self.affinity[i]
+            t = threading.Thread(target=self._serve, args=[server])
+            t.daemon = True
+            self._servers.append(server)
+            self._threads.append(t)
+
+        for t in self._threads:
+            t.start()
+
+    # Seconds between wake-ups of a worker that hasn't exited yet
+    stop_interval = 0.1
+
+    def stop(self, timeout=None):
+        """Stop all servers, interrupting tests that are still running
+
+        A server that wasn't listening yet when woken up is woken up again
+        until its worker exits.
+
+        :param timeout: optional seconds to wait for each worker
+        """
+        self._stopping.set()
+        for server in self._servers:
+            server.stop()
+        for server, t in zip(self._servers, self._threads):
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while True:
+                wait = self.stop_interval
+                if deadline is not None:
+                    wait = min(wait, deadline - time.monotonic())
+                t.join(max(wait, 0))
+                if not t.is_alive() or wait <= 0:
+                    break
+                server.stop()
+            if not t.is_alive():
+                server.close()
+
+    def _publish(self, result):
+        self.results.put(result)
+        if self.callback is not None:
+            try:
+                self.callback(result)
+            except Exception:
+                logger.exception("ServerPool callback failed")
+
+    def _serve(self, server):
+        """Worker thread, runs tests on a single port until stopped
+
+        Failures to run a test, e.g. pinning to an unavailable core, are
+        published as error results and the server is retried.
+        """
+        while not self._stopping.is_set():
+            try:
+                result = TestResult(server._run_json())
+            except Exception as e:
+                result = TestResult(json.dumps({"error": str(e)}))
+
+            if self._stopping.is_set():
+                break
+
+            self._publish(result)
+            if result.error:
+                self._stopping.wait(self.retry_delay)
+
+
+class ClientPool(object):
+    """A pool of reusable, pre-configured clients per target.
+
+    Clients are kept between tests so running the same probe repeatedly
+    doesn't allocate a new libiperf test, fds and pipe every time.
+
+    Basic Usage::
+
+      >>> from iperf.iperf3 import ClientPool
+
+      >>> pool = ClientPool(settings={'duration': 5})
+      >>> with pool.client('10.0.0.1', 5201) as client:
+      ...     result = client.run()
+    """
+
+    def __init__(self, max_idle=4, settings=None, lib_name=None, verbose=False):
+        """Initialise the client pool
+
+        :param max_idle: maximum number of idle clients kept per target
+        :param settings: optional dict of :class:`Client` settings applied
+            to every client handed out
+        :param lib_name: optional name and path for libiperf.so.0 library
+        :param verbose: enable verbose output
+        """
+        self.max_idle = max_idle
+        self.settings = dict(settings or {})
+        self.lib_name = lib_name
+        self.verbose = verbose
+
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._defaults = None
+
+    def _settings(self, server_hostname, port, settings):
+        # Start from libiperf's defaults so per test settings of a previous
+        # acquire don't leak into the next one, settings that can't be
+        # restored this way are handled by _reusable
+        merged = dict(self._defaults)
+        merged.update(self.settings)
+        merged.update(settings or {})
+        merged.update(server_hostname=server_hostname, port=port)
+        return merged
+
+    def prewarm(self, server_hostname, port=5201, count=1, settings=None):
+        """Create idle clients for a target ahead of time
+
+        :param count: number of clients to keep ready, up to ``max_idle``
+        """
+        with self._lock:
+            idle = self._idle.setdefault((server_hostname, port), deque())
+            missing = min(count, self.max_idle) - len(idle)
+
+        for _ in range(missing):
+            client = self.acquire(server_hostname, port, settings)
+            self.release(client)
+
+    def acquire(self, server_hostname, port=5201, settings=None):
+        """Get a configured client for a target
+
+        :param server_hostname: The server hostname to connect to
+        :param port: The port the iperf3 server is listening on
+        :param settings: optional dict of :class:`Client` settings for
+            this test, on top of the pool settings
+        :rtype: instance of :class:`Client`
+        """
+        with self._lock:
+            idle = self._idle.get((server_hostname, port))
+            client = idle.popleft() if idle else None
+
+        if client is None:
+            client = Client(verbose=self.verbose, lib_name=self.lib_name)
+            if self._defaults is None:
+                self._defaults = client.get_settings()
+        client.apply_settings(self._settings(server_hostname, port, settings))
+        return client
+
+    def _reusable(self, client):
+        """True unless the client holds a setting apply_settings can't undo
+
+        libiperf can't unset string settings again, e.g. a per test
+        congestion_control or bind_address, they are reported as None or
+        '*' and skipped by :meth:`Client.apply_settings`.
+        """
+        current = client.get_settings()
+        for name, default in self._defaults.items():
+            if default is None or (name == "bind_address" and default == "*"):
+                if current.get(name) != self.settings.get(name, default):
+                    return False
+        return True
+
+    def release(self, client):
+        """Return a client to the pool
+
+        Clients with per test settings that can't be reset are closed
+        instead of being kept.
+
+        :param client: instance of :class:`Client` from :meth:`acquire`
+        """
+        if client.closed or not self._reusable(client):
+            client.close()
+            return
+
+        key = (client.server_hostname, client.port)
+        with self._lock:
+            idle = self._idle.setdefault(key, deque())
+            if len(idle) < self.max_idle:
+                idle.append(client)
+                return
+
+        client.close()
+
+    @contextmanager
+    def client(self, server_hostname, port=5201, settings=None):
+        """Context manager acquiring and releasing a client
+
+        :rtype: instance of :class:`Client`
+        """
+        client = self.acquire(server_hostname, port, settings)
+        try:
+            yield client
+        finally:
+            self.release(client)
+
+    def clear(self):
+        """Close all idle clients"""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+
+        for clients in idle.values():
+            for client in clients:
+                client.close()
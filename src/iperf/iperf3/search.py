@@ -0,0 +1,171 @@
+from collections import namedtuple
+
+
+class Probe(
+    namedtuple("Probe", ["rate", "passed", "lost_percent", "jitter_ms", "reason"])
+):
+    """A single rate probe of :func:`find_max_rate`
+
+    :param rate: The probed bandwidth in bits/sec
+    :param passed: True if loss and jitter stayed below the thresholds
+    :param lost_percent: The measured packet loss, None if unknown
+    :param jitter_ms: The measured jitter, None if unknown
+    :param reason: Why the probe failed, None if it passed
+    """
+
+    __slots__ = ()
+
+
+class RateSearchResult(namedtuple("RateSearchResult", ["rate", "probes"])):
+    """The outcome of :func:`find_max_rate`
+
+    :param rate: The highest probed rate that passed, None if none did
+    :param probes: list of :class:`Probe` in the order they ran
+    """
+
+    __slots__ = ()
+
+
+def _exceeds(value, threshold):
+    return threshold is not None and value is not None and value > threshold
+
+
+def _probe(client, rate, loss_threshold, jitter_threshold):
+    """Run a single probe at the given rate
+
+    The test is stopped as soon as an interval reports loss or jitter
+    above the thresholds. Only the receiver reports them per interval, so
+    this needs the client to receive, i.e. a reverse test.
+
+    :rtype: instance of :class:`Probe`
+    """
+    stopped = []
+
+    def _on_interval(interval):
+        summary = interval.get("sum", {})
+        if not stopped and (
+            _exceeds(summary.get("lost_percent"), loss_threshold)
+            or _exceeds(summary.get("jitter_ms"), jitter_threshold)
+        ):
+            stopped.append(summary)
+            client.stop()
+
+    client.bandwidth = int(rate)
+    result = client.run(on_interval=_on_interval)
+
+    if stopped:
+        summary = stopped[0]
+        return Probe(
+            rate,
+            False,
+            summary.get("lost_percent"),
+            summary.get("jitter_ms"),
+            "stopped early, thresholds exceeded",
+        )
+    if result.error:
+        return Probe(rate, False, None, None, result.error)
+
+    lost_percent = getattr(result, "lost_percent", None)
+    jitter_ms = getattr(result, "jitter_ms", None)
+    if _exceeds(lost_percent, loss_threshold):
+        return Probe(rate, False, lost_percent, jitter_ms, "loss above threshold")
+    if _exceeds(jitter_ms, jitter_threshold):
+        return Probe(rate, False, lost_percent, jitter_ms, "jitter above threshold")
+    return Probe(rate, True, lost_percent, jitter_ms, None)
+
+
+def find_max_rate(
+    client,
+    loss_threshold=0.1,
+    jitter_threshold=None,
+    start_rate=10 * 1000 * 1000,
+    max_rate=100 * 1000 * 1000 * 1000,
+    precision=0.05,
+    probe_duration=2,
+    max_probes=20,
+    reverse=True,
+):
+    """Find the highest UDP bandwidth staying below a loss threshold
+
+    The rate is doubled from ``start_rate`` until a probe fails, then the
+    boundary is narrowed down with a binary search until the passing and
+    failing rates are within ``precision`` of each other. All probes reuse
+    the libiperf test of ``client``, whose settings are restored afterwards.
+
+    By default the server to client direction is probed. The client is
+    the receiver then, sees the loss of every interval and stops failing
+    probes early. When probing the client to server direction the loss is
+    only known from the server's summary, so every probe runs for its full
+    duration.
+
+    Basic Usage::
+
+      >>> from iperf.iperf3.search import find_max_rate
+
+      >>> client = iperf3.Client()
+      >>> client.server_hostname = '10.0.0.1'
+      >>> search = find_max_rate(client, loss_threshold=0.5)
+      >>> search.rate
+      940000000
+
+    :param client: configured instance of :class:`Client`
+    :param loss_threshold: maximum packet loss in percent
+    :param jitter_threshold: optional maximum jitter in milliseconds
+    :param start_rate: first rate probed in bits/sec
+    :param max_rate: highest rate probed in bits/sec
+    :param precision: relative width of the final search interval
+    :param probe_duration: duration of every probe in seconds
+    :param max_probes: maximum number of probes to run
+    :param reverse: probe the server to client direction, allowing failing
+        probes to stop early
+    :rtype: instance of :class:`RateSearchResult`
+    """
+    if start_rate <= 0 or max_rate < start_rate:
+        raise ValueError("Expected 0 < start_rate <= max_rate")
+    if not 0 < precision < 1:
+        raise ValueError("precision has to be between 0 and 1")
+
+    settings = client.get_settings()
+    client.protocol = "udp"
+    client.duration = probe_duration
+    if reverse and settings.get("bidirectional"):
+        client.bidirectional = False
+    client.reverse = reverse
+
+    probes = []
+    passed, failed = None, None
+
+    def _run(rate):
+        probe = _probe(client, rate, loss_threshold, jitter_threshold)
+        probes.append(probe)
+        return probe.passed
+
+    try:
+        # Exponential phase: find a failing rate
+        rate = start_rate
+        while len(probes) < max_probes:
+            if _run(rate):
+                passed = rate
+                if rate >= max_rate:
+                    break
+                rate = min(rate * 2, max_rate)
+            else:
+                failed = rate
+                break
+
+        # Binary phase: narrow down between the last pass and first fail
+        low = passed or 0
+        while (
+            failed is not None
+            and len(probes) < max_probes
+            and failed - low > precision * failed
+        ):
+            rate = int((low + failed) / 2)
+            if _run(rate):
+                low = passed = rate
+            else:
+                failed = rate
+    finally:
+        client.apply_settings(settings)
+
+    return RateSearchResult(passed, probes)
@@ -1,7 +1,8 @@
+import socket
 import threading
 from queue import Queue
 
-from iperf.iperf3._iperf3 import IPerf3, output_to_pipe, output_to_screen, read_pipe
+from iperf.iperf3._iperf3 import IPerf3, extract_json
 from iperf.iperf3.test_result import TestResult
 
 
@@ -28,34 +29,59 @@ class Server(IPerf3):
         """Initialise the iperf3 server instance"""
         super(Server, self).__init__(role="s", *args, **kwargs)
 
+    def _run_json(self):
+        """Runs iperf_run_server capturing the json result
+
+        :rtype: the raw json result text
+        """
+        error, data = self._run_captured(self.lib.iperf_run_server)
+        data = extract_json(self._json_output_string() or data)
+
+        if not data or error:
+            data = '{"error": "%s"}' % self._error_to_string(self._errno)
+
+        self._reset_test()
+        return data
+
+    def stop(self):
+        """Interrupt the server running in another thread
+
+        A server still waiting for a client is woken up by a short lived
+        connection to its own listener, which makes libiperf return.
+        """
+        if (
+            not hasattr(self.lib, "iperf_get_control_socket")
+            or self.lib.iperf_get_control_socket(self._test) >= 0
+        ):
+            super(Server, self).stop()
+            return
+
+        host = self.bind_address
+        if host == "*":
+            host = "localhost"
+
+        try:
+            socket.create_connection((host, self.port), timeout=1).close()
+        except OSError:
+            pass
+
     def run(self):
         """Run the iperf3 server instance.
 
         :rtype: instance of :class:`TestResult`
         """
+        self._ensure_open()
 
         def _run_in_thread(self, data_queue):
             """Runs the iperf_run_server
 
-            :param data_queue: thread-safe queue
+            :param data_queue: thread-safe queue, receives the json result
+                or the exception raised
             """
-            output_to_pipe(self._pipe_in)  # disable stdout
-            error = self.lib.iperf_run_server(self._test)
-            output_to_screen(self._stdout_fd, self._stderr_fd)  # enable stdout
-
-            # TODO json_output_string not available on earlier iperf3 builds
-            # have to build in a version check using self.iperf_version
-            # The following line should work on later versions:
-            # data = c_char_p(
-            #    self.lib.iperf_get_test_json_output_string(self._test)
-            # ).value
-            data = read_pipe(self._pipe_out)
-
-            if not data or error:
-                data = '{"error": "%s"}' % self._error_to_string(self._errno)
-
-            self.lib.iperf_reset_test(self._test)
-            data_queue.put(data)
+            try:
+                data_queue.put(self._run_json())
+            except BaseException as e:
+                data_queue.put(e)
 
         if self.json_output:
             data_queue = Queue()
@@ -67,10 +93,13 @@ class Server(IPerf3):
             while t.is_alive():
                 t.join(0.1)
 
-            return TestResult(data_queue.get())
+            data = data_queue.get()
+            if isinstance(data, BaseException):
+                raise data
+            return TestResult(data)
         else:
             # setting json_output to False will output test to screen only
             self.lib.iperf_run_server(self._test)
-            self.lib.iperf_reset_test(self._test)
+            self._reset_test()
 
             return None
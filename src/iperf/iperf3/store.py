@@ -0,0 +1,238 @@
+import math
+import sqlite3
+
+from iperf.iperf3.test_result import INTERVAL_COLUMNS, interval_columns
+
+# Summary columns of the results table and the TestResult attribute (or
+# callable) each one is read from
+RESULT_COLUMNS = (
+    ("timestamp", "INTEGER", "timesecs"),
+    ("type", "TEXT", "type"),
+    ("local_host", "TEXT", "local_host"),
+    ("local_port", "INTEGER", "local_port"),
+    ("remote_host", "TEXT", "remote_host"),
+    ("remote_port", "INTEGER", "remote_port"),
+    ("protocol", "TEXT", "protocol"),
+    ("reverse", "INTEGER", "reverse"),
+    ("num_streams", "INTEGER", "num_streams"),
+    ("blksize", "INTEGER", "blksize"),
+    ("omit", "INTEGER", "omit"),
+    ("duration", "INTEGER", "duration"),
+    ("local_cpu_total", "REAL", "local_cpu_total"),
+    ("remote_cpu_total", "REAL", "remote_cpu_total"),
+    ("sent_bytes", "INTEGER", "sent_bytes"),
+    ("sent_bps", "REAL", "sent_bps"),
+    ("received_bytes", "INTEGER", "received_bytes"),
+    ("received_bps", "REAL", "received_bps"),
+    ("retransmits", "INTEGER", "retransmits"),
+    ("bytes", "INTEGER", "bytes"),
+    ("bps", "REAL", "bps"),
+    ("jitter_ms", "REAL", "jitter_ms"),
+    ("packets", "INTEGER", "packets"),
+    ("lost_packets", "INTEGER", "lost_packets"),
+    ("lost_percent", "REAL", "lost_percent"),
+)
+
+_SQL_TYPES = {"float64": "REAL", "int64": "INTEGER"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    {result_columns}
+);
+CREATE INDEX IF NOT EXISTS results_host_time_protocol
+    ON results (remote_host, timestamp, protocol);
+CREATE TABLE IF NOT EXISTS intervals (
+    result_id INTEGER NOT NULL REFERENCES results (id) ON DELETE CASCADE,
+    {interval_columns}
+);
+CREATE INDEX IF NOT EXISTS intervals_result ON intervals (result_id);
+""".format(
+    result_columns=",\n    ".join(
+        "{} {}".format(name, sql_type) for name, sql_type, _ in RESULT_COLUMNS
+    ),
+    interval_columns=",\n    ".join(
+        '"{}" {}'.format(name, _SQL_TYPES[dtype]) for name, dtype in INTERVAL_COLUMNS
+    ),
+)
+
+
+def _percentile(values, p):
+    """Nearest rank percentile of sorted values"""
+    rank = max(int(math.ceil(p / 100.0 * len(values))), 1)
+    return values[rank - 1]
+
+
+class ResultStore(object):
+    """Persistent SQLite store for test results.
+
+    Summaries go to the ``results`` table, the interval sums to the
+    ``intervals`` table. Writes are buffered and committed in batches, the
+    database runs in WAL mode so readers don't block the writer.
+
+    Basic Usage::
+
+      >>> from iperf.iperf3.store import ResultStore
+
+      >>> with ResultStore('results.db') as store:
+      ...     store.add(client.run())
+      ...     store.last('10.0.0.1', n=5)
+      ...     store.percentile('sent_bps', 95, since=time.time() - 3600)
+    """
+
+    def __init__(self, path, batch_size=100, intervals=True):
+        """Open or create the store
+
+        :param path: The SQLite database file, ':memory:' for a temporary one
+        :param batch_size: number of results buffered before a commit
+        :param intervals: also store the interval rows of every result
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.intervals = intervals
+        self._pending = []
+
+        self._db = sqlite3.connect(path)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Commit buffered results and close the database"""
+        if self._db is not None:
+            self.flush()
+            self._db.close()
+            self._db = None
+
+    def add(self, result):
+        """Buffer a result, committing once ``batch_size`` are pending
+
+        Error results are ignored.
+
+        :param result: instance of :class:`TestResult`
+        :rtype: bool, True if the result will be stored
+        """
+        if result.error:
+            return False
+
+        self._pending.append(result)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+        return True
+
+    def add_many(self, results):
+        """Store results in a single transaction
+
+        :rtype: int, the number of results stored
+        """
+        stored = sum(1 for result in results if self.add(result))
+        self.flush()
+        return stored
+
+    def flush(self):
+        """Commit all buffered results"""
+        if not self._pending:
+            return
+
+        names = [name for name, _, _ in RESULT_COLUMNS]
+        insert_result = "INSERT INTO results ({}) VALUES ({})".format(
+            ", ".join(names), ", ".join("?" * len(names))
+        )
+        interval_names = [name for name, _ in INTERVAL_COLUMNS]
+        insert_interval = 'INSERT INTO intervals (result_id, "{}") VALUES ({})'.format(
+            '", "'.join(interval_names), ", ".join("?" * (len(interval_names) + 1))
+        )
+
+        with self._db:
+            for result in self._pending:
+                row = [getattr(result, attr, None) for _, _, attr in RESULT_COLUMNS]
+                result_id = self._db.execute(insert_result, row).lastrowid
+
+                data = getattr(result, "json", None) if self.intervals else None
+                if not data:
+                    continue
+
+                columns = interval_columns(data.get("intervals", []))
+                rows = zip(*(columns[name] for name in interval_names))
+                self._db.executemany(
+                    insert_interval,
+                    (
+                        [result_id] + [None if v != v else v for v in values]
+                        for values in rows
+                    ),
+                )
+
+        self._pending = []
+
+    def last(self, remote_host, n=10, protocol=None):
+        """The last n results stored for a host, newest first
+
+        :param remote_host: The remote host of the results
+        :param n: maximum number of results
+        :param protocol: optional 'TCP' or 'UDP'
+        :rtype: list of dicts
+        """
+        self.flush()
+        query = "SELECT * FROM results WHERE remote_host = ?"
+        args = [remote_host]
+        if protocol is not None:
+            query += " AND protocol = ?"
+            args.append(protocol)
+        query += " ORDER BY timestamp DESC, id DESC LIMIT ?"
+        args.append(n)
+        return [dict(row) for row in self._db.execute(query, args)]
+
+    def intervals_of(self, result_id):
+        """The interval rows of a stored result
+
+        :rtype: list of dicts
+        """
+        self.flush()
+        rows = self._db.execute(
+            "SELECT * FROM intervals WHERE result_id = ? ORDER BY start", (result_id,)
+        )
+        return [dict(row) for row in rows]
+
+    def percentile(self, column, p, since=None, until=None, protocol=None):
+        """A percentile of a result column per remote host over a window
+
+        :param column: result column, e.g. 'sent_bps' or 'jitter_ms'
+        :param p: percentile between 0 and 100
+        :param since: optional start of the window, in seconds since epoch
+        :param until: optional end of the window, in seconds since epoch
+        :param protocol: optional 'TCP' or 'UDP'
+        :rtype: dict of remote host and percentile value
+        """
+        if column not in [name for name, _, _ in RESULT_COLUMNS]:
+            raise ValueError("Unknown result column {}".format(column))
+        if not 0 <= p <= 100:
+            raise ValueError("Percentile has to be between 0 and 100")
+
+        self.flush()
+        query = "SELECT remote_host, {0} FROM results WHERE {0} IS NOT NULL".format(
+            column
+        )
+        args = []
+        for condition, value in (
+            ("timestamp >= ?", since),
+            ("timestamp <= ?", until),
+            ("protocol = ?", protocol),
+        ):
+            if value is not None:
+                query += " AND " + condition
+                args.append(value)
+        query += " ORDER BY remote_host, {}".format(column)
+
+        values = {}
+        for host, value in self._db.execute(query, args):
+            values.setdefault(host, []).append(value)
+
+        return dict((host, _percentile(v, p)) for host, v in values.items())
@@ -0,0 +1,154 @@
+import itertools
+from collections import namedtuple
+
+
+class SweepRow(
+    namedtuple(
+        "SweepRow",
+        ["config", "throughput_bps", "local_cpu_total", "remote_cpu_total", "result"],
+    )
+):
+    """A ranked configuration of :class:`Sweep`
+
+    :param config: dict of the :class:`Client` settings tested
+    :param throughput_bps: received bits per second (TCP) or bps (UDP),
+        0 for failed tests
+    :param local_cpu_total: The local total CPU load
+    :param remote_cpu_total: The remote total CPU load
+    :param result: The :class:`TestResult` of the test
+    """
+
+    __slots__ = ()
+
+    @property
+    def bps_per_cpu(self):
+        """Throughput per percent of local CPU load, a measure of cost"""
+        if not self.local_cpu_total:
+            return None
+        return self.throughput_bps / self.local_cpu_total
+
+
+def grid(**params):
+    """Expand a parameter grid into a list of configurations
+
+    Basic Usage::
+
+      >>> grid(blksize=[8192, 131072], num_streams=[1, 4])
+      [{'blksize': 8192, 'num_streams': 1}, {'blksize': 8192, 'num_streams': 4}, ...
+
+    :rtype: list of dicts
+    """
+    names = sorted(params)
+    return [
+        dict(zip(names, values))
+        for values in itertools.product(*(params[name] for name in names))
+    ]
+
+
+def _throughput(result):
+    if result.error:
+        return 0
+    if result.protocol == "UDP":
+        return result.bps
+    return result.received_bps
+
+
+class Sweep(object):
+    """Runs a client over a set of configurations and ranks them.
+
+    Every configuration runs on top of the client's settings at the start
+    of the sweep. Results are cached on those settings, the configuration
+    and the duration, so repeated sweeps or overlapping searches only run
+    new configurations. Failed tests aren't cached. Pass a persistent
+    mapping as ``cache`` to share results between sweeps.
+
+    Basic Usage::
+
+      >>> from iperf.iperf3.sweep import Sweep, grid
+
+      >>> sweep = Sweep(client)
+      >>> table = sweep.run(grid(blksize=[8192, 131072], zerocopy=[False, True]))
+      >>> table[0].config, table[0].throughput_bps
+    """
+
+    def __init__(self, client, cache=None):
+        """Initialise the sweep
+
+        :param client: configured instance of :class:`Client`, its
+            settings are restored after every sweep
+        :param cache: optional mapping used as result cache
+        """
+        self.client = client
+        self.cache = cache if cache is not None else {}
+
+    def _key(self, base, config, duration):
+        base = dict((name, value) for name, value in base.items() if name != "duration")
+        return repr((sorted(base.items()), sorted(config.items()), duration))
+
+    def _run_config(self, base, config, duration):
+        """Run a single configuration, or return its cached row"""
+        key = self._key(base, config, duration)
+        if key in self.cache:
+            return self.cache[key]
+
+        settings = dict(base)
+        settings.update(config)
+        settings["duration"] = duration
+        self.client.apply_settings(settings)
+        result = self.client.run()
+
+        row = SweepRow(
+            dict(config),
+            _throughput(result),
+            getattr(result, "local_cpu_total", None),
+            getattr(result, "remote_cpu_total", None),
+            result,
+        )
+        if not result.error:
+            self.cache[key] = row
+        return row
+
+    def _run_all(self, configs, duration):
+        settings = self.client.get_settings()
+        try:
+            rows = [self._run_config(settings, config, duration) for config in configs]
+        finally:
+            self.client.apply_settings(settings)
+        return sorted(rows, key=lambda row: row.throughput_bps, reverse=True)
+
+    def run(self, configs, duration=None):
+        """Run every configuration once
+
+        :param configs: iterable of dicts of :class:`Client` settings
+        :param duration: optional test duration, the client's by default
+        :rtype: list of :class:`SweepRow`, highest throughput first
+        """
+        return self._run_all(list(configs), duration or self.client.duration)
+
+    def successive_halving(self, configs, min_duration=1, eta=2, max_duration=None):
+        """Rank configurations with successive halving
+
+        All configurations run for ``min_duration`` seconds, the best
+        ``1/eta`` of them run again for ``eta`` times as long, and so on
+        until a single configuration is left or ``max_duration`` is reached.
+
+        :param configs: iterable of dicts of :class:`Client` settings
+        :param min_duration: duration of the first round in seconds
+        :param eta: reduction factor between rounds, at least 2
+        :param max_duration: optional duration limit in seconds
+        :rtype: list of :class:`SweepRow` of the final round, highest
+            throughput first
+        """
+        if eta < 2:
+            raise ValueError("eta has to be at least 2")
+
+        configs = list(configs)
+        duration = min_duration
+        while True:
+            rows = self._run_all(configs, duration)
+            keep = max(len(rows) // eta, 1)
+            if len(rows) == 1 or (max_duration and duration * eta > max_duration):
+                return rows
+
+            configs = [row.config for row in rows[:keep]]
+            duration *= eta
@@ -1,5 +1,291 @@
 import json
 
+# Attribute names parse_summary can produce
+SUMMARY_FIELDS = (
+    "error",
+    "time",
+    "timesecs",
+    "system_info",
+    "version",
+    "local_host",
+    "local_port",
+    "remote_host",
+    "remote_port",
+    "tcp_mss_default",
+    "tcp_mss",
+    "sock_bufsize",
+    "sndbuf_actual",
+    "rcvbuf_actual",
+    "sender_tcp_congestion",
+    "receiver_tcp_congestion",
+    "protocol",
+    "bidirectional",
+    "num_streams",
+    "blksize",
+    "omit",
+    "duration",
+    "num_bytes",
+    "num_blocks",
+    "target_bitrate",
+    "fqrate",
+    "pacing_timer",
+    "burst",
+    "transfer_seconds",
+    "stop_reason",
+    "reporter_interval",
+    "num_intervals",
+    "local_cpu_total",
+    "local_cpu_user",
+    "local_cpu_system",
+    "remote_cpu_total",
+    "remote_cpu_user",
+    "remote_cpu_system",
+    "sent_bytes",
+    "sent_bps",
+    "received_bytes",
+    "received_bps",
+    "sent_kbps",
+    "sent_Mbps",
+    "sent_kB_s",
+    "sent_MB_s",
+    "received_kbps",
+    "received_Mbps",
+    "received_kB_s",
+    "received_MB_s",
+    "retransmits",
+    "bidir_reverse_sent_bytes",
+    "bidir_reverse_sent_bps",
+    "bidir_reverse_sent_Mbps",
+    "bidir_reverse_received_bytes",
+    "bidir_reverse_received_bps",
+    "bidir_reverse_received_Mbps",
+    "bidir_reverse_retransmits",
+    "bytes",
+    "bps",
+    "jitter_ms",
+    "kbps",
+    "Mbps",
+    "kB_s",
+    "MB_s",
+    "packets",
+    "lost_packets",
+    "lost_percent",
+    "seconds",
+    "bidir_reverse_bytes",
+    "bidir_reverse_bps",
+    "bidir_reverse_Mbps",
+    "bidir_reverse_jitter_ms",
+    "bidir_reverse_packets",
+    "bidir_reverse_lost_packets",
+    "bidir_reverse_lost_percent",
+)
+
+
+# Interval fields exported by TestResult.intervals_array and their dtypes.
+# Fields libiperf doesn't report for a test are filled with NaN, so every
+# column is a float.
+INTERVAL_COLUMNS = (
+    ("start", "float64"),
+    ("end", "float64"),
+    ("bytes", "float64"),
+    ("bits_per_second", "float64"),
+    ("retransmits", "float64"),
+    ("snd_cwnd", "float64"),
+    ("rtt", "float64"),
+    ("jitter_ms", "float64"),
+    ("lost_packets", "float64"),
+)
+
+
+def interval_columns(intervals, streams=False, direction="forward"):
+    """Convert libiperf intervals to column lists
+
+    :param intervals: The ``intervals`` list of a libiperf result
+    :param streams: return one row per stream and interval, with extra
+        ``socket`` and ``sender`` columns, instead of one row per interval
+        sum. Streams of both directions are included
+    :param direction: 'forward', or 'reverse' for the reverse sums of a
+        bidirectional test
+    :rtype: dict of column name and list of values
+    """
+    if direction not in ("forward", "reverse"):
+        raise ValueError(
+            "Unknown direction, accepted values are 'forward' and 'reverse'"
+        )
+
+    nan = float("nan")
+    key = "sum" if direction == "forward" else "sum_bidir_reverse"
+    columns = dict((name, []) for name, _ in INTERVAL_COLUMNS)
+    if streams:
+        columns["socket"] = []
+        columns["sender"] = []
+
+    for interval in intervals:
+        if streams:
+            rows = interval.get("streams", [])
+        else:
+            rows = [interval[key]] if key in interval else []
+
+        for row in rows:
+            for name, _ in INTERVAL_COLUMNS:
+                value = row.get(name)
+                columns[name].append(nan if value is None else value)
+            if streams:
+                columns["socket"].append(row.get("socket", -1))
+                sender = row.get("sender")
+                columns["sender"].append(nan if sender is None else float(sender))
+
+    return columns
+
+
+def parse_summary(data):
+    """Extract the summary fields of a decoded libiperf result
+
+    :param data: The decoded json document
+    :rtype: dict of :class:`TestResult` attribute names and values
+    """
+    summary = {}
+
+    if "error" in data:
+        summary["error"] = data["error"]
+    else:
+        summary["error"] = None
+
+        # start time
+        summary["time"] = data["start"]["timestamp"]["time"]
+        summary["timesecs"] = data["start"]["timestamp"]["timesecs"]
+
+        # generic info
+        summary["system_info"] = data["start"]["system_info"]
+        summary["version"] = data["start"]["version"]
+
+        # connection details
+        connection_details = data["start"]["connected"][0]
+        summary["local_host"] = connection_details["local_host"]
+        summary["local_port"] = connection_details["local_port"]
+        summary["remote_host"] = connection_details["remote_host"]
+        summary["remote_port"] = connection_details["remote_port"]
+
+        # test setup
+        summary["tcp_mss_default"] = data["start"].get("tcp_mss_default")
+        summary["tcp_mss"] = data["start"].get("tcp_mss", summary["tcp_mss_default"])
+        summary["sock_bufsize"] = data["start"].get("sock_bufsize")
+        summary["sndbuf_actual"] = data["start"].get("sndbuf_actual")
+        summary["rcvbuf_actual"] = data["start"].get("rcvbuf_actual")
+        summary["protocol"] = data["start"]["test_start"]["protocol"]
+        summary["bidirectional"] = bool(data["start"]["test_start"].get("bidir"))
+        summary["num_streams"] = data["start"]["test_start"]["num_streams"]
+        summary["blksize"] = data["start"]["test_start"]["blksize"]
+        summary["omit"] = data["start"]["test_start"]["omit"]
+        summary["duration"] = data["start"]["test_start"]["duration"]
+        summary["num_bytes"] = data["start"]["test_start"].get("bytes", 0)
+        summary["num_blocks"] = data["start"]["test_start"].get("blocks", 0)
+
+        # pacing, libiperf only reports the target and fq rates (iperf >= 3.13),
+        # Client fills in the applied settings
+        summary["target_bitrate"] = data["start"]["test_start"].get("target_bitrate")
+        summary["fqrate"] = data["start"]["test_start"].get("fqrate")
+        summary["pacing_timer"] = data["start"]["test_start"].get("pacing_timer")
+        summary["burst"] = data["start"]["test_start"].get("burst")
+
+        # why the test ended before its duration, set by Client.convergence
+        summary["stop_reason"] = data.get("stop_reason")
+
+        # reporting, libiperf versions not reporting the configured interval
+        # leave it to Client to fill in
+        summary["num_intervals"] = len(data.get("intervals") or [])
+        summary["reporter_interval"] = data["start"]["test_start"].get("interval")
+
+        # negotiated TCP congestion control, iperf >= 3.1
+        summary["sender_tcp_congestion"] = data["end"].get("sender_tcp_congestion")
+        summary["receiver_tcp_congestion"] = data["end"].get("receiver_tcp_congestion")
+
+        # system performance
+        cpu_utilization_perc = data["end"]["cpu_utilization_percent"]
+        summary["local_cpu_total"] = cpu_utilization_perc["host_total"]
+        summary["local_cpu_user"] = cpu_utilization_perc["host_user"]
+        summary["local_cpu_system"] = cpu_utilization_perc["host_system"]
+        summary["remote_cpu_total"] = cpu_utilization_perc["remote_total"]
+        summary["remote_cpu_user"] = cpu_utilization_perc["remote_user"]
+        summary["remote_cpu_system"] = cpu_utilization_perc["remote_system"]
+
+        # TCP specific test results
+        if summary["protocol"] == "TCP":
+            sent_json = data["end"]["sum_sent"]
+            summary["sent_bytes"] = sent_json["bytes"]
+            summary["sent_bps"] = sent_json["bits_per_second"]
+
+            recv_json = data["end"]["sum_received"]
+            summary["received_bytes"] = recv_json["bytes"]
+            summary["received_bps"] = recv_json["bits_per_second"]
+
+            # Bits are measured in 10**3 terms
+            # Bytes are measured in 2**10 terms
+            # kbps = Kilobits per second
+            # Mbps = Megabits per second
+            # kB_s = kiloBytes per second
+            # MB_s = MegaBytes per second
+
+            summary["sent_kbps"] = summary["sent_bps"] / 1000
+            summary["sent_Mbps"] = summary["sent_kbps"] / 1000
+            summary["sent_kB_s"] = summary["sent_bps"] / (8 * 1024)
+            summary["sent_MB_s"] = summary["sent_kB_s"] / 1024
+
+            summary["received_kbps"] = summary["received_bps"] / 1000
+            summary["received_Mbps"] = summary["received_kbps"] / 1000
+            summary["received_kB_s"] = summary["received_bps"] / (8 * 1024)
+            summary["received_MB_s"] = summary["received_kB_s"] / 1024
+
+            # retransmits only returned from client
+            summary["retransmits"] = sent_json.get("retransmits")
+
+            # time it took to transfer the data
+            summary["transfer_seconds"] = sent_json.get(
+                "seconds", sent_json.get("end", 0) - sent_json.get("start", 0)
+            )
+
+            # reverse direction of a bidirectional test
+            if "sum_sent_bidir_reverse" in data["end"]:
+                sent_json = data["end"]["sum_sent_bidir_reverse"]
+                recv_json = data["end"]["sum_received_bidir_reverse"]
+                summary["bidir_reverse_sent_bytes"] = sent_json["bytes"]
+                summary["bidir_reverse_sent_bps"] = sent_json["bits_per_second"]
+                summary["bidir_reverse_sent_Mbps"] = sent_json["bits_per_second"] / 1e6
+                summary["bidir_reverse_received_bytes"] = recv_json["bytes"]
+                summary["bidir_reverse_received_bps"] = recv_json["bits_per_second"]
+                summary["bidir_reverse_received_Mbps"] = (
+                    recv_json["bits_per_second"] / 1e6
+                )
+                summary["bidir_reverse_retransmits"] = sent_json.get("retransmits")
+
+        # UDP specific test results
+        elif summary["protocol"] == "UDP":
+            summary["bytes"] = data["end"]["sum"]["bytes"]
+            summary["bps"] = data["end"]["sum"]["bits_per_second"]
+            summary["jitter_ms"] = data["end"]["sum"]["jitter_ms"]
+            summary["kbps"] = summary["bps"] / 1000
+            summary["Mbps"] = summary["kbps"] / 1000
+            summary["kB_s"] = summary["bps"] / (8 * 1024)
+            summary["MB_s"] = summary["kB_s"] / 1024
+            summary["packets"] = data["end"]["sum"]["packets"]
+            summary["lost_packets"] = data["end"]["sum"]["lost_packets"]
+            summary["lost_percent"] = data["end"]["sum"]["lost_percent"]
+            summary["seconds"] = data["end"]["sum"]["seconds"]
+            summary["transfer_seconds"] = summary["seconds"]
+
+            # reverse direction of a bidirectional test
+            if "sum_bidir_reverse" in data["end"]:
+                reverse_json = data["end"]["sum_bidir_reverse"]
+                summary["bidir_reverse_bytes"] = reverse_json["bytes"]
+                summary["bidir_reverse_bps"] = reverse_json["bits_per_second"]
+                summary["bidir_reverse_Mbps"] = reverse_json["bits_per_second"] / 1e6
+                summary["bidir_reverse_jitter_ms"] = reverse_json["jitter_ms"]
+                summary["bidir_reverse_packets"] = reverse_json["packets"]
+                summary["bidir_reverse_lost_packets"] = reverse_json["lost_packets"]
+                summary["bidir_reverse_lost_percent"] = reverse_json["lost_percent"]
+
+    return summary
+
 
 class TestResult(object):
     """Class containing iperf3 test results.
@@ -20,11 +306,27 @@ class TestResult(object):
     :param remote_port: Remote port number
 
     :param reverse: Test ran in reverse direction
+    :param bidirectional: Test ran in both directions at the same time
     :param protocol: 'TCP' or 'UDP'
     :param num_streams: Number of test streams
     :param blksize:
     :param omit: Test duration to omit in the beginning in seconds
     :param duration: Test duration (following omit duration) in seconds
+    :param num_bytes: Number of bytes the test was limited to, 0 if none
+    :param num_blocks: Number of blocks the test was limited to, 0 if none
+    :param target_bitrate: Target bandwidth in bits/sec (iperf >= 3.13)
+    :param fqrate: Fair queueing pacing rate in bits/sec (iperf >= 3.13, or
+        as applied by :class:`Client`)
+    :param pacing_timer: Pacing period in microseconds, as applied by
+        :class:`Client`
+    :param burst: Packets sent per pacing period, as applied by
+        :class:`Client`
+    :param transfer_seconds: Time it took to transfer the data in seconds
+    :param stop_reason: Why :attr:`Client.convergence` ended the test
+        early, None if it ran in full
+    :param reporter_interval: Configured length of the reported intervals
+        in seconds, as reported by libiperf or applied by :class:`Client`
+    :param num_intervals: Number of reported intervals
 
     :param local_cpu_total: The local total CPU load
     :param local_cpu_user: The local user CPU load
@@ -37,6 +339,12 @@ class TestResult(object):
     TCP test specific
 
     :param tcp_mss_default:
+    :param tcp_mss: The MSS used, the configured one or tcp_mss_default
+    :param sock_bufsize: The requested socket buffer size (iperf >= 3.9)
+    :param sndbuf_actual: The send buffer size used (iperf >= 3.9)
+    :param rcvbuf_actual: The receive buffer size used (iperf >= 3.9)
+    :param sender_tcp_congestion: Congestion control used by the sender
+    :param receiver_tcp_congestion: Congestion control used by the receiver
     :param retransmits: amount of retransmits (Only returned from client)
 
     :param sent_bytes: Sent bytes
@@ -53,6 +361,12 @@ class TestResult(object):
     :param received_kB_s: Received kiloBytes per second
     :param received_MB_s: Received MegaBytes per second
 
+    :param bidir_reverse_sent_bytes: Sent bytes in the reverse direction of
+        a bidirectional test, likewise bidir_reverse_sent_bps,
+        bidir_reverse_sent_Mbps, bidir_reverse_received_bytes,
+        bidir_reverse_received_bps, bidir_reverse_received_Mbps and
+        bidir_reverse_retransmits
+
 
     UDP test specific
 
@@ -67,6 +381,11 @@ class TestResult(object):
     :param lost_packets:
     :param lost_percent:
     :param seconds:
+
+    :param bidir_reverse_bps: bps in the reverse direction of a
+        bidirectional test, likewise bidir_reverse_bytes,
+        bidir_reverse_Mbps, bidir_reverse_jitter_ms, bidir_reverse_packets,
+        bidir_reverse_lost_packets and bidir_reverse_lost_percent
     """
 
     def __init__(self, result):
@@ -78,86 +397,41 @@ class TestResult(object):
         self.text = result
         self.json = json.loads(result)
 
-        if "error" in self.json:
-            self.error = self.json["error"]
-        else:
-            self.error = None
-
-            # start time
-            self.time = self.json["start"]["timestamp"]["time"]
-            self.timesecs = self.json["start"]["timestamp"]["timesecs"]
-
-            # generic info
-            self.system_info = self.json["start"]["system_info"]
-            self.version = self.json["start"]["version"]
-
-            # connection details
-            connection_details = self.json["start"]["connected"][0]
-            self.local_host = connection_details["local_host"]
-            self.local_port = connection_details["local_port"]
-            self.remote_host = connection_details["remote_host"]
-            self.remote_port = connection_details["remote_port"]
-
-            # test setup
-            self.tcp_mss_default = self.json["start"].get("tcp_mss_default")
-            self.protocol = self.json["start"]["test_start"]["protocol"]
-            self.num_streams = self.json["start"]["test_start"]["num_streams"]
-            self.blksize = self.json["start"]["test_start"]["blksize"]
-            self.omit = self.json["start"]["test_start"]["omit"]
-            self.duration = self.json["start"]["test_start"]["duration"]
-
-            # system performance
-            cpu_utilization_perc = self.json["end"]["cpu_utilization_percent"]
-            self.local_cpu_total = cpu_utilization_perc["host_total"]
-            self.local_cpu_user = cpu_utilization_perc["host_user"]
-            self.local_cpu_system = cpu_utilization_perc["host_system"]
-            self.remote_cpu_total = cpu_utilization_perc["remote_total"]
-            self.remote_cpu_user = cpu_utilization_perc["remote_user"]
-            self.remote_cpu_system = cpu_utilization_perc["remote_system"]
-
-            # TCP specific test results
-            if self.protocol == "TCP":
-                sent_json = self.json["end"]["sum_sent"]
-                self.sent_bytes = sent_json["bytes"]
-                self.sent_bps = sent_json["bits_per_second"]
-
-                recv_json = self.json["end"]["sum_received"]
-                self.received_bytes = recv_json["bytes"]
-                self.received_bps = recv_json["bits_per_second"]
-
-                # Bits are measured in 10**3 terms
-                # Bytes are measured in 2**10 terms
-                # kbps = Kilobits per second
-                # Mbps = Megabits per second
-                # kB_s = kiloBytes per second
-                # MB_s = MegaBytes per second
-
-                self.sent_kbps = self.sent_bps / 1000
-                self.sent_Mbps = self.sent_kbps / 1000
-                self.sent_kB_s = self.sent_bps / (8 * 1024)
-                self.sent_MB_s = self.sent_kB_s / 1024
-
-                self.received_kbps = self.received_bps / 1000
-                self.received_Mbps = self.received_kbps / 1000
-                self.received_kB_s = self.received_bps / (8 * 1024)
-                self.received_MB_s = self.received_kB_s / 1024
-
-                # retransmits only returned from client
-                self.retransmits = sent_json.get("retransmits")
-
-            # UDP specific test results
-            elif self.protocol == "UDP":
-                self.bytes = self.json["end"]["sum"]["bytes"]
-                self.bps = self.json["end"]["sum"]["bits_per_second"]
-                self.jitter_ms = self.json["end"]["sum"]["jitter_ms"]
-                self.kbps = self.bps / 1000
-                self.Mbps = self.kbps / 1000
-                self.kB_s = self.bps / (8 * 1024)
-                self.MB_s = self.kB_s / 1024
-                self.packets = self.json["end"]["sum"]["packets"]
-                self.lost_packets = self.json["end"]["sum"]["lost_packets"]
-                self.lost_percent = self.json["end"]["sum"]["lost_percent"]
-                self.seconds = self.json["end"]["sum"]["seconds"]
+        self.__dict__.update(parse_summary(self.json))
+
+    def intervals_array(self, streams=False, direction="forward"):
+        """The test intervals as column oriented NumPy arrays
+
+        Columns are listed in ``INTERVAL_COLUMNS``; missing values are NaN.
+        Requires numpy.
+
+        Basic Usage::
+
+          >>> bps = result.intervals_array()['bits_per_second']
+          >>> numpy.percentile(bps, 95)
+
+        :param streams: one row per stream and interval, with extra
+            ``socket`` and ``sender`` columns, instead of one row per
+            interval sum
+        :param direction: 'forward', or 'reverse' for the reverse sums of
+            a bidirectional test
+        :rtype: dict of column name and numpy.ndarray
+        """
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError(
+                "numpy is required for intervals_array, "
+                "install it with: pip install iperf[numpy]"
+            )
+
+        dtypes = dict(INTERVAL_COLUMNS)
+        dtypes.update(socket="int64", sender="float64")
+        columns = interval_columns(self.json.get("intervals", []), streams, direction)
+        return dict(
+            (name, numpy.array(values, dtype=dtypes[name]))
+            for name, values in columns.items()
+        )
 
     @property
     def reverse(self):
@@ -176,3 +450,111 @@ class TestResult(object):
     def __repr__(self):
         """Print the result as received from iperf3"""
         return self.text
+
+
+class _SummaryField(object):
+    """Descriptor decoding the summary of a :class:`CompactTestResult`
+    on first access"""
+
+    def __init__(self, name):
+        self.name = name
+        self.slot = "_" + name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        if not instance._decoded:
+            instance._decode()
+        try:
+            return getattr(instance, self.slot)
+        except AttributeError:
+            # Field not reported for this protocol, same as TestResult
+            raise AttributeError(
+                "'{}' object has no attribute '{}'".format(owner.__name__, self.name)
+            )
+
+
+class CompactTestResult(object):
+    """Memory efficient variant of :class:`TestResult`
+
+    Uses ``__slots__`` and only decodes the json document when a summary
+    field is first accessed. The decoded document itself is not kept, only
+    the summary values are, and the raw text can be released with
+    :meth:`drop_text`. Summary attributes have the same names as on
+    :class:`TestResult`.
+
+    Basic Usage::
+
+      >>> result = CompactTestResult(text, keep_text=False)
+      >>> result.sent_bps
+      935992000
+    """
+
+    __slots__ = ("_text", "_decoded", "_reverse", "_type") + tuple(
+        "_" + name for name in SUMMARY_FIELDS
+    )
+
+    def __init__(self, result, keep_text=True):
+        """Initialise CompactTestResult
+
+        :param result: raw json output from :class:`Client` and :class:`Server`
+        :param keep_text: keep the raw json text, when False the summary is
+            decoded immediately and the text released
+        """
+        self._text = result
+        self._decoded = False
+
+        if not keep_text:
+            self.drop_text()
+
+    @classmethod
+    def from_result(cls, result, keep_text=True):
+        """Create a compact copy of a :class:`TestResult`
+
+        :rtype: instance of :class:`CompactTestResult`
+        """
+        return cls(result.text, keep_text=keep_text)
+
+    def _decode(self):
+        data = json.loads(self._text)
+        for name, value in parse_summary(data).items():
+            setattr(self, "_" + name, value)
+
+        if "error" not in data:
+            self._reverse = bool(data["start"]["test_start"]["reverse"])
+            self._type = "client" if "connecting_to" in data["start"] else "server"
+        self._decoded = True
+
+    def drop_text(self):
+        """Decode the summary and release the raw json text
+
+        :attr:`text` and :attr:`json` are unavailable afterwards.
+        """
+        if not self._decoded:
+            self._decode()
+        self._text = None
+
+    @property
+    def text(self):
+        """The raw result from libiperf as text, None once dropped"""
+        return self._text
+
+    @property
+    def json(self):
+        """The raw result decoded on every access, None once dropped"""
+        if self._text is None:
+            return None
+        return json.loads(self._text)
+
+    def __repr__(self):
+        """Print the result as received from iperf3"""
+        if self._text is not None:
+            return self._text
+        return "<CompactTestResult protocol={} error={}>".format(
+            getattr(self, "protocol", None), self.error
+        )
+
+
+for _name in SUMMARY_FIELDS + ("reverse", "type"):
+    setattr(CompactTestResult, _name, _SummaryField(_name))
+del _name
@@ -1,11 +1,89 @@
+import asyncio
+import json
 import os
-from iperf.iperf3 import Client, Server, TestResult
-from iperf.iperf3._iperf3 import IPerf3
+from math import isnan
+from iperf.iperf3 import (
+    Client,
+    ClientPool,
+    CompactTestResult,
+    Server,
+    ServerPool,
+    TestResult,
+)
+from iperf.iperf3.aio import AsyncClient, AsyncServer
+from iperf.iperf3.archive import read_archive, write_archive
+from iperf.iperf3.convergence import CoefficientOfVariation, ConfidenceInterval
+from iperf.iperf3.exporter import MetricsRegistry, MetricsServer
+from iperf.iperf3.fleet import Fleet, Job, _run_job, _stale
+from iperf.iperf3.ingest import ingest, iter_documents
+from iperf.iperf3.placement import parse_cpulist, plan_cores
+from iperf.iperf3.search import find_max_rate
+from iperf.iperf3.store import ResultStore
+from iperf.iperf3.sweep import Sweep, grid
+from iperf.iperf3.test_result import interval_columns
+from iperf.iperf3._iperf3 import (
+    IPerf3,
+    JsonStreamParser,
+    PipeReader,
+    _release,
+    extract_json,
+    live_tests,
+    load_library,
+)
+from types import SimpleNamespace
+
 import pytest
 import subprocess
+import threading
+import urllib.request
 from time import sleep
 
 
+@pytest.fixture
+def results_json():
+    """The text of the sample result in tests/results.json"""
+    dirname = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(dirname, "results.json")) as f:
+        return f.read()
+
+
+class SimulatedClient(object):
+    """Stands in for a Client in tests of the helpers driving one
+
+    Settings are kept in a dict and read and written as attributes. Every
+    run records the settings it ran with and returns what ``simulate``
+    returns for the client and the interval callback.
+    """
+
+    def __init__(self, simulate, **settings):
+        self.__dict__.update(
+            settings=settings, simulate=simulate, runs=[], stopped=False
+        )
+
+    def __getattr__(self, name):
+        try:
+            return self.settings[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        self.settings[name] = value
+
+    def get_settings(self):
+        return dict(self.settings)
+
+    def apply_settings(self, settings):
+        self.settings.update(settings)
+
+    def stop(self):
+        self.__dict__["stopped"] = True
+
+    def run(self, on_interval=None):
+        self.__dict__["stopped"] = False
+        self.runs.append(dict(self.settings))
+        return self.simulate(self, on_interval)
+
+
 def isclose(a, b, rel_tol=1e-09, abs_tol=0.0):
     return abs(a - b) <= max(rel_tol * max(abs(a), abs(b)), abs_tol)
 
@@ -23,6 +101,15 @@ class TestPyPerf:
         client = Client(lib_name="libiperf.so.0")
         assert client._test
 
+    def test_library_shared(self):
+        """The loaded library is prototyped once and shared"""
+        assert Client().lib is Server().lib
+        assert load_library() is Client().lib
+
+    def test_library_not_found(self):
+        with pytest.raises(OSError):
+            load_library("libdoesnotexist.so.0")
+
     def test_run_not_implemented(self):
         with pytest.raises(NotImplementedError):
             client = IPerf3(role="c")
@@ -113,6 +200,100 @@ class TestPyPerf:
         client.num_streams = 666
         assert client.num_streams == 666
 
+    def test_intervals(self):
+        client = Client()
+        client.reporter_interval = 0.5
+        client.stats_interval = 0.5
+        assert client.reporter_interval == 0.5
+        assert client.stats_interval == 0.5
+
+        with pytest.raises(ValueError):
+            client.reporter_interval = 0.01
+        with pytest.raises(ValueError):
+            client.stats_interval = 61
+
+    def test_tcp_tuning(self):
+        client = Client()
+        client.socket_bufsize = 262144
+        client.mss = 1400
+        client.no_delay = True
+        client.congestion_control = "cubic"
+
+        assert client.socket_bufsize == 262144
+        assert client.mss == 1400
+        assert client.no_delay
+        assert client.congestion_control == "cubic"
+
+        with pytest.raises(ValueError):
+            client.mss = -1
+
+    def test_bidirectional(self):
+        client = Client()
+        client.bidirectional = True
+        assert client.bidirectional
+
+        client.bidirectional = False
+        assert not client.bidirectional
+
+    def test_num_bytes_blocks(self):
+        client = Client()
+        client.num_bytes = 1024**3
+        assert client.num_bytes == 1024**3
+
+        client.num_blocks = 100
+        assert client.num_blocks == 100
+
+        with pytest.raises(ValueError):
+            client.num_bytes = -1
+
+        with pytest.raises(ValueError):
+            client.run()
+
+        client.num_bytes = 0
+        assert client.num_bytes == 0
+        assert client.get_settings()["num_blocks"] == 100
+
+    def test_connect_timeout(self):
+        client = Client()
+        assert client.connect_timeout is None
+
+        client.connect_timeout = 2.5
+        assert client.connect_timeout == 2.5
+        assert client.get_settings()["connect_timeout"] == 2.5
+
+        client.connect_timeout = None
+        assert client.connect_timeout is None
+
+        with pytest.raises(ValueError):
+            client.connect_timeout = 0
+
+    def test_pacing(self):
+        client = Client()
+        client.pacing_timer = 100
+        assert client.pacing_timer == 100
+
+        client.burst = 10
+        assert client.burst == 10
+
+        client.fqrate = 10**9
+        assert client.fqrate == 10**9
+
+        with pytest.raises(ValueError):
+            client.burst = 1001
+        with pytest.raises(ValueError):
+            client.pacing_timer = 0
+
+    def test_affinity(self):
+        client = Client()
+        assert client.affinity == -1
+
+        client.affinity = 0
+        assert client.affinity == 0
+        assert client.get_settings()["affinity"] == 0
+
+        with pytest.raises(ValueError):
+            client.affinity = -2
+
     def test_json_output_enabled(self):
         client = Client()
         client.json_output = True
@@ -335,3 +516,883 @@ class TestPyPerf:
 
         assert isclose(result.received_kB_s, 114046.387, rel_tol=0.01)
         assert isclose(result.received_MB_s, 111.373, rel_tol=0.01)
+
+    def test_result_bounded(self, results_json):
+        """Tests bounded by bytes or blocks report how long they took"""
+        data = json.loads(results_json)
+
+        result = TestResult(json.dumps(data))
+        assert result.num_bytes == 0
+        assert result.num_blocks == 0
+        assert result.transfer_seconds == 13.0001
+
+        data["start"]["test_start"]["bytes"] = 1024**3
+        result = TestResult(json.dumps(data))
+        assert result.num_bytes == 1024**3
+
+    def test_result_tcp_tuning(self, results_json):
+        """The negotiated TCP parameters are reported when available"""
+        data = json.loads(results_json)
+
+        result = TestResult(json.dumps(data))
+        assert result.tcp_mss == 1448
+        assert result.sock_bufsize is None
+        assert result.sender_tcp_congestion is None
+
+        data["start"]["tcp_mss"] = 1400
+        data["start"]["sock_bufsize"] = 262144
+        data["end"]["sender_tcp_congestion"] = "bbr"
+        data["end"]["receiver_tcp_congestion"] = "cubic"
+        result = TestResult(json.dumps(data))
+        assert result.tcp_mss == 1400
+        assert result.tcp_mss_default == 1448
+        assert result.sock_bufsize == 262144
+        assert result.sender_tcp_congestion == "bbr"
+        assert result.receiver_tcp_congestion == "cubic"
+
+    def test_result_intervals(self, results_json):
+        """The reporter interval is the configured one, not a measured one"""
+        data = json.loads(results_json)
+
+        result = TestResult(json.dumps(data))
+        assert result.num_intervals == 13
+        assert result.reporter_interval is None
+
+        data["start"]["test_start"]["interval"] = 0.5
+        data["intervals"][0]["sum"]["seconds"] = 0.9
+        result = TestResult(json.dumps(data))
+        assert result.reporter_interval == 0.5
+
+    def test_pipe_reader_large_output(self):
+        """Output larger than the kernel pipe buffer must not block the writer"""
+        pipe_out, pipe_in = os.pipe()
+        payload = b"x" * (1024 * 1024)
+
+        reader = PipeReader(pipe_out, bufsize=1024)
+        reader.start()
+        os.write(pipe_in, payload)
+        data = reader.stop()
+
+        os.close(pipe_out)
+        os.close(pipe_in)
+        assert len(data) == len(payload)
+
+    def test_extract_json(self):
+        data = 'Control connection MSS 1448\n{"start": {}}'
+        assert extract_json(data) == '{"start": {}}'
+        assert extract_json('{"error": "x"}') == '{"error": "x"}'
+        assert extract_json("") == ""
+
+    def test_json_stream_parser_events(self):
+        intervals = []
+        parser = JsonStreamParser(intervals.append)
+        lines = (
+            b'{"event": "start", "data": {"version": "iperf 3.17"}}\n'
+            b'{"event": "interval", "data": {"streams": [], "sum": {"bytes": 1}}}\n'
+            b'{"event": "interval", "data": {"streams": [], "sum": {"bytes": 2}}}\n'
+            b'{"event": "end", "data": {"sum_sent": {}}}\n'
+        )
+        # Feed in small chunks to split events across reads
+        for i in range(0, len(lines), 7):
+            parser.feed(lines[i : i + 7])
+
+        assert [i["sum"]["bytes"] for i in intervals] == [1, 2]
+        assert parser.start == {"version": "iperf 3.17"}
+        assert parser.end == {"sum_sent": {}}
+        assert '"intervals"' in parser.document
+
+    def test_json_stream_parser_document(self, results_json):
+        data = results_json.encode("utf-8")
+
+        intervals = []
+        parser = JsonStreamParser(intervals.append)
+        for i in range(0, len(data), 1000):
+            parser.feed(data[i : i + 1000])
+
+        assert len(intervals) == 13
+        assert parser.end["sum_sent"]["bits_per_second"] == 935992000
+
+    def test_json_stream_parser_large_document(self, results_json):
+        """A document split over many reads is decoded once"""
+        data = json.loads(results_json)
+        data["intervals"] = data["intervals"] * 500
+        text = "Control connection MSS 1448\n{}\n".format(json.dumps(data, indent=4))
+        text = text.encode("utf-8")
+
+        parser = JsonStreamParser()
+        decoder = parser._decoder
+        calls = []
+
+        class _CountingDecoder(object):
+            def decode(self, s):
+                calls.append(len(s))
+                return decoder.decode(s)
+
+        parser._decoder = _CountingDecoder()
+        for i in range(0, len(text), 64 * 1024):
+            parser.feed(text[i : i + 64 * 1024])
+
+        assert len(calls) == 1
+        assert len(parser.intervals) == 13 * 500
+        assert json.loads(parser.document)["end"] == data["end"]
+
+    def test_client_run_stream(self):
+        client = Client()
+        client.server_hostname = "127.0.0.1"
+        client.port = 5209
+        client.duration = 2
+
+        server = subprocess.Popen(["iperf3", "-s", "-p", "5209"])
+        sleep(0.3)  # give the server some time to start
+        intervals = list(client.run_stream())
+        server.kill()
+
+        assert len(intervals) >= 2
+        assert "sum" in intervals[0]
+
+    def test_run_stream_early_exit(self):
+        """Leaving run_stream early stops the test running in the thread"""
+
+        threads = []
+
+        def simulate(client, on_interval):
+            threads.append(threading.current_thread())
+            while not client.stopped:
+                on_interval({"sum": {"bits_per_second": 1.0}})
+                sleep(0.01)
+
+        client = SimulatedClient(simulate)
+        stream = Client.run_stream(client)
+        assert next(stream)["sum"]["bits_per_second"] == 1.0
+        stream.close()
+        assert client.stopped
+        assert not threads[0].is_alive()
+
+    def test_concurrent_clients(self):
+        """Clients running in parallel threads must not mix their results"""
+        import threading
+
+        server = subprocess.Popen(["iperf3", "-s", "-p", "5210"])
+        server2 = subprocess.Popen(["iperf3", "-s", "-p", "5211"])
+        sleep(0.3)  # give the servers some time to start
+
+        results = {}
+
+        def _run(port):
+            client = Client()
+            client.server_hostname = "127.0.0.1"
+            client.port = port
+            client.duration = 1
+            results[port] = client.run()
+
+        threads = [threading.Thread(target=_run, args=[p]) for p in (5210, 5211)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        server.kill()
+        server2.kill()
+
+        assert results[5210].remote_port == 5210
+        assert results[5211].remote_port == 5211
+
+    def test_fleet_errors_in_order(self):
+        """Failing jobs are reported as error results, in job order"""
+        jobs = [("127.0.0.1", 5201 + i) for i in range(5)]
+        with Fleet(max_workers=2, lib_name="libdoesnotexist.so.0") as fleet:
+            results = list(fleet.run(jobs))
+
+        assert [job.port for job, _ in results] == [5201 + i for i in range(5)]
+        assert all("libdoesnotexist" in result.error for _, result in results)
+
+    def test_fleet_timeout_workers(self):
+        """Workers of a timed out test don't run other jobs next to it"""
+        closed = []
+
+        class _Client(object):
+            def close(self):
+                closed.append(True)
+
+        stale = threading.Thread(target=sleep, args=(0.2,))
+        stale.start()
+        _stale.append((stale, _Client()))
+        _run_job(Job("127.0.0.1"), 1, "libdoesnotexist.so.0")
+        assert not stale.is_alive()
+        assert closed == [True]
+
+        with Fleet(max_workers=1, timeout=1, lib_name="libdoesnotexist.so.0") as f:
+            results = list(f.run([("127.0.0.1", 5201)] * 3))
+        assert len(results) == 3
+
+    def test_fleet_run(self):
+        server = subprocess.Popen(["iperf3", "-s", "-p", "5212"])
+        sleep(0.3)  # give the server some time to start
+
+        jobs = [Job("127.0.0.1", 5212, {"duration": 1})]
+        with Fleet(max_workers=1, timeout=10) as fleet:
+            results = list(fleet.run(jobs, ordered=False))
+        server.kill()
+
+        assert results[0][1].remote_port == 5212
+
+    def test_async_client_run(self):
+        client = AsyncClient()
+        client.server_hostname = "127.0.0.1"
+        client.port = 5213
+        client.duration = 1
+        assert client.duration == 1
+
+        server = subprocess.Popen(["iperf3", "-s", "-p", "5213"])
+        sleep(0.3)  # give the server some time to start
+        response = asyncio.run(client.run())
+        server.kill()
+
+        assert response.remote_port == 5213
+
+    def test_async_server_cancel(self):
+        """Cancelling a waiting server must stop the libiperf test"""
+        server = AsyncServer()
+        server.bind_address = "127.0.0.1"
+        server.port = 5214
+
+        async def _cancel():
+            task = asyncio.ensure_future(server.run())
+            await asyncio.sleep(0.3)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(_cancel())
+
+    def test_server_pool(self):
+        pool = ServerPool([5215, 5216], bind_address="127.0.0.1")
+        pool.start()
+
+        clients = [
+            subprocess.Popen(
+                ["iperf3", "-c", "127.0.0.1", "-p", str(port), "-t", "1"],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+            for port in (5215, 5216)
+        ]
+        results = [pool.results.get(timeout=10) for _ in clients]
+        pool.stop(timeout=5)
+
+        assert sorted(result.local_port for result in results) == [5215, 5216]
+        assert not pool.running
+
+    def test_compact_result(self, results_json):
+        result = TestResult(results_json)
+        compact = CompactTestResult(results_json)
+        assert not compact._decoded
+        assert compact.sent_bps == result.sent_bps
+        assert compact.received_MB_s == result.received_MB_s
+        assert compact.reverse == result.reverse
+        assert compact.type == result.type
+        assert not hasattr(compact, "__dict__")
+
+        compact.drop_text()
+        assert compact.text is None
+        assert compact.retransmits == result.retransmits
+        with pytest.raises(AttributeError):
+            compact.jitter_ms
+
+    def test_compact_result_error(self):
+        compact = CompactTestResult('{"error": "unable to connect"}', keep_text=False)
+        assert compact.error == "unable to connect"
+        assert "unable to connect" in repr(compact)
+
+    def test_interval_columns(self, results_json):
+        result = TestResult(results_json)
+
+        columns = interval_columns(result.json["intervals"])
+        assert len(columns["bits_per_second"]) == 13
+        assert columns["bytes"][0] == 118766408
+        # rtt is only reported per stream
+        assert isnan(columns["rtt"][0])
+
+        columns = interval_columns(result.json["intervals"], streams=True)
+        assert columns["socket"][0] == 4
+        assert columns["snd_cwnd"][0] == 573408
+
+    def test_intervals_array(self, results_json):
+        numpy = pytest.importorskip("numpy")
+        result = TestResult(results_json)
+
+        arrays = result.intervals_array()
+        assert arrays["bytes"].dtype == numpy.float64
+        assert arrays["end"].shape == (13,)
+
+    def test_intervals_array_missing_values(self, results_json):
+        numpy = pytest.importorskip("numpy")
+        data = json.loads(results_json)
+
+        del data["intervals"][3]["streams"][0]["bytes"]
+        arrays = TestResult(json.dumps(data)).intervals_array(streams=True)
+        assert numpy.isnan(arrays["bytes"][3])
+        assert arrays["bytes"][2] == data["intervals"][2]["streams"][0]["bytes"]
+
+    def test_ingest(self, tmp_path, results_json):
+        compact = json.dumps(json.loads(results_json))
+        (tmp_path / "single.json").write_text(results_json)
+        (tmp_path / "log.jsonl").write_text(
+            "\n".join([compact, '{"error": "x"}', "{broken", compact]) + "\n"
+        )
+
+        errors = []
+        results = list(
+            ingest(str(tmp_path), workers=0, on_error=lambda *e: errors.append(e))
+        )
+        assert len(results) == 3
+        assert all(result.sent_bps == 935992000 for result in results)
+        assert all(result.text is None for result in results)
+        assert len(errors) == 2
+
+        results = list(
+            ingest(str(tmp_path / "single.json"), workers=1, result_class=TestResult)
+        )
+        assert results[0].json["start"]["test_start"]["duration"] == 13
+
+        batches = list(
+            ingest(str(tmp_path / "*.json*"), workers=2, chunksize=1, columnar=True)
+        )
+        assert sum(len(batch["sent_bps"]) for batch in batches) == 3
+
+    def test_iter_documents_truncated(self, results_json):
+        """A truncated pretty printed document is a single error"""
+        truncated = results_json[: len(results_json) // 2]
+        documents = list(iter_documents(truncated + "\n" + results_json))
+        assert [error is None for _, error in documents] == [False, True]
+        assert json.loads(documents[1][0])["start"]
+
+    def test_result_store(self, tmp_path, results_json):
+        with ResultStore(str(tmp_path / "results.db"), batch_size=2) as store:
+            assert store.add_many([TestResult(results_json)] * 3) == 3
+            assert not store.add(TestResult('{"error": "x"}'))
+
+            last = store.last("192.168.0.188", n=2, protocol="TCP")
+            assert len(last) == 2
+            assert last[0]["sent_bps"] == 935992000
+            assert len(store.intervals_of(last[0]["id"])) == 13
+
+            p95 = store.percentile("sent_bps", 95, since=1498663888)
+            assert p95 == {"192.168.0.188": 935992000}
+            assert store.percentile("sent_bps", 95, since=1498663889) == {}
+
+    def test_archive_array_format(self, tmp_path, results_json):
+        results = [
+            TestResult(results_json),
+            TestResult('{"error": "x"}'),
+            TestResult(results_json),
+        ]
+        write_archive(str(tmp_path), results, format="array")
+
+        columns = read_archive(str(tmp_path), ["remote_host", "sent_bps"])
+        assert sorted(columns) == ["remote_host", "sent_bps"]
+        assert columns["remote_host"] == ["192.168.0.188"] * 2
+        assert list(columns["sent_bps"]) == [935992000.0] * 2
+
+        intervals = read_archive(str(tmp_path), table="intervals")
+        assert len(intervals["result"]) == 26
+        assert intervals["bytes"][0] == 118766408
+        assert isnan(intervals["jitter_ms"][0])
+
+    def test_archive_arrow_format(self, tmp_path, results_json):
+        pytest.importorskip("pyarrow")
+        import gc
+
+        results = [
+            TestResult(results_json),
+            TestResult('{"error": "x"}'),
+            TestResult(results_json),
+        ]
+        write_archive(str(tmp_path), results)
+        assert (tmp_path / "results.arrow").exists()
+        assert (tmp_path / "intervals.arrow").exists()
+
+        columns = read_archive(str(tmp_path), ["remote_host", "sent_bps", "other"])
+        assert sorted(columns) == ["remote_host", "sent_bps"]
+
+        # The columns are read from the memory map of the file
+        gc.collect()
+        assert columns["remote_host"].to_pylist() == ["192.168.0.188"] * 2
+        assert columns["sent_bps"].to_pylist() == [935992000.0] * 2
+
+        intervals = read_archive(str(tmp_path), table="intervals")
+        assert len(intervals["result"]) == 26
+        assert intervals["bytes"][0].as_py() == 118766408
+        assert isnan(intervals["jitter_ms"][0].as_py())
+
+    def test_find_max_rate(self):
+        """Search converges on the loss boundary of a simulated link"""
+        capacity = 937 * 1000 * 1000
+
+        def simulate(client, on_interval):
+            lost = 5.0 if client.bandwidth > capacity else 0.0
+            return SimpleNamespace(error=None, jitter_ms=0.1, lost_percent=lost)
+
+        client = SimulatedClient(simulate, bandwidth=0, protocol="tcp", duration=10)
+        search = find_max_rate(client, loss_threshold=1, precision=0.01)
+
+        assert search.rate <= capacity
+        assert search.rate > capacity * 0.99
+        assert len(search.probes) <= 20
+        assert client.protocol == "tcp"
+        assert client.duration == 10
+
+    def test_find_max_rate_early_stop(self):
+        """Failing probes stop early in reverse mode only"""
+        capacity = 100 * 1000 * 1000
+        intervals = []
+
+        def simulate(client, on_interval):
+            lost = 5.0 if client.bandwidth > capacity else 0.0
+            count = 0
+            while count < client.duration and not client.stopped:
+                count += 1
+                # Like libiperf, only the receiving side reports loss
+                summary = {"lost_percent": lost} if client.reverse else {}
+                on_interval({"sum": summary})
+            intervals.append(count)
+            return SimpleNamespace(error=None, jitter_ms=0.1, lost_percent=lost)
+
+        client = SimulatedClient(
+            simulate, bandwidth=0, protocol="tcp", duration=10, reverse=False
+        )
+        search = find_max_rate(client, loss_threshold=1, probe_duration=4)
+        failed = [p for p in search.probes if not p.passed]
+        assert failed[0].reason == "stopped early, thresholds exceeded"
+        assert min(intervals) == 1
+        assert not client.reverse
+
+        del intervals[:]
+        search = find_max_rate(
+            client, loss_threshold=1, probe_duration=4, reverse=False
+        )
+        assert intervals == [4] * len(search.probes)
+        assert search.rate <= capacity
+        assert not any(p.reason and "early" in p.reason for p in search.probes)
+
+    def test_sweep(self):
+        """Configurations are ranked by throughput and cached"""
+
+        def simulate(client, on_interval):
+            return SimpleNamespace(
+                error=None,
+                protocol="TCP",
+                local_cpu_total=10.0,
+                remote_cpu_total=5.0,
+                received_bps=client.blksize * min(client.num_streams, 4),
+            )
+
+        client = SimulatedClient(simulate, duration=10, blksize=1, num_streams=1)
+        configs = grid(blksize=[1, 2, 4], num_streams=[1, 4, 8])
+        assert len(configs) == 9
+
+        sweep = Sweep(client)
+        table = sweep.run(configs)
+        assert table[0].throughput_bps == 16
+        assert table[0].config["blksize"] == 4
+        assert table[0].bps_per_cpu == 1.6
+        assert len(client.runs) == 9
+        assert client.settings == {"duration": 10, "blksize": 1, "num_streams": 1}
+
+        sweep.run(configs)
+        assert len(client.runs) == 9
+
+        table = sweep.successive_halving(configs, min_duration=1)
+        assert table[0].config["blksize"] == 4
+        assert len(client.runs) == 9 + 9 + 4 + 2 + 1
+
+    def test_sweep_base_settings(self):
+        """Configurations run on the base settings, failures aren't cached"""
+        outcome = {"error": None}
+
+        def simulate(client, on_interval):
+            return SimpleNamespace(
+                error=outcome["error"], protocol="TCP", received_bps=client.blksize
+            )
+
+        client = SimulatedClient(
+            simulate, duration=10, blksize=1, num_streams=1, server_hostname="a"
+        )
+        sweep = Sweep(client)
+        sweep.run([{"blksize": 4}, {"num_streams": 2}])
+        assert client.runs[1]["blksize"] == 1
+        assert len(client.runs) == 2
+
+        client.server_hostname = "b"
+        sweep.run([{"blksize": 4}])
+        assert len(client.runs) == 3
+
+        outcome["error"] = "unable to connect to server"
+        sweep.run([{"blksize": 8}])
+        outcome["error"] = None
+        table = sweep.run([{"blksize": 8}])
+        assert len(client.runs) == 5
+        assert table[0].throughput_bps == 8
+
+    def test_client_rerun(self):
+        """A client can run repeatedly and keeps its configuration"""
+        client = Client()
+        client.server_hostname = "127.0.0.1"
+        client.port = 5217
+        client.duration = 1
+        client.num_streams = 2
+
+        server = subprocess.Popen(["iperf3", "-s", "-p", "5217"])
+        sleep(0.3)  # give the server some time to start
+        first = client.run()
+        second = client.run()
+        server.kill()
+
+        assert not first.error
+        assert not second.error
+        assert second.num_streams == 2
+        assert client.port == 5217
+
+    def test_client_num_bytes_run(self):
+        """A byte limit replaces the duration for the run"""
+        client = Client()
+        client.server_hostname = "127.0.0.1"
+        client.port = 5220
+        client.duration = 1
+        client.bandwidth = 8 * 1000 * 1000
+        client.num_bytes = 2 * 1000 * 1000
+
+        server = subprocess.Popen(["iperf3", "-s", "-p", "5220"])
+        sleep(0.3)  # give the server some time to start
+        result = client.run()
+        server.kill()
+
+        assert not result.error
+        assert result.num_bytes == 2 * 1000 * 1000
+        assert result.transfer_seconds > 1.5
+        assert client.duration == 1
+
+    def test_client_pool(self):
+        pool = ClientPool(max_idle=1, settings={"duration": 3})
+        pool.prewarm("127.0.0.1", 5218, count=2)
+
+        with pool.client("127.0.0.1", 5218, {"reverse": True}) as client:
+            assert client.duration == 3
+            assert client.reverse
+
+        again = pool.acquire("127.0.0.1", 5218)
+        assert again is client
+        assert not again.reverse
+
+    def test_client_pool_string_settings(self):
+        """Settings libiperf can't unset don't leak into later acquires"""
+        pool = ClientPool()
+        with pool.client("127.0.0.1", 5218, {"congestion_control": "bbr"}) as client:
+            assert client.congestion_control == "bbr"
+
+        assert client.closed
+        with pool.client("127.0.0.1", 5218) as again:
+            assert again is not client
+            assert again.congestion_control is None
+
+    def test_close(self):
+        before = live_tests()
+        with Client() as client:
+            assert live_tests() == before + 1
+            assert not client.closed
+
+        assert client.closed
+        assert live_tests() == before
+        client.close()  # idempotent
+        assert live_tests() == before
+
+        with pytest.raises(ValueError):
+            client.run()
+
+    def test_closed_settings(self):
+        """The libiperf test isn't touched once freed"""
+        client = Client()
+        client.close()
+
+        with pytest.raises(ValueError):
+            client.duration
+        with pytest.raises(ValueError):
+            client.port = 5201
+        with pytest.raises(ValueError):
+            client.get_settings()
+        with pytest.raises(ValueError):
+            client.apply_settings({"duration": 1})
+        with pytest.raises(ValueError):
+            client.stop()
+
+    def test_release_keeps_ended_client_fds(self):
+        """Releasing a test doesn't end the client a second time"""
+        calls = []
+
+        class SimulatedLibrary(object):
+            def __getattr__(self, name):
+                return lambda *args: calls.append(name)
+
+        fds = os.pipe()
+        _release(SimulatedLibrary(), None, fds[:1], fds[1], None)
+        assert calls == ["iperf_free_test"]
+
+    def test_garbage_collected(self):
+        before = live_tests()
+        Server()
+        assert live_tests() == before
+
+    def test_bidirectional_result(self, results_json):
+        data = json.loads(results_json)
+
+        data["start"]["test_start"]["bidir"] = 1
+        data["end"]["sum_sent_bidir_reverse"] = {
+            "bytes": 1000,
+            "bits_per_second": 2e6,
+            "retransmits": 3,
+        }
+        data["end"]["sum_received_bidir_reverse"] = {
+            "bytes": 900,
+            "bits_per_second": 1.8e6,
+        }
+        for interval in data["intervals"]:
+            interval["sum_bidir_reverse"] = dict(interval["sum"], bytes=1)
+
+        result = TestResult(json.dumps(data))
+        assert result.bidirectional
+        assert result.sent_bps == 935992000
+        assert result.bidir_reverse_sent_Mbps == 2
+        assert result.bidir_reverse_received_bps == 1.8e6
+        assert result.bidir_reverse_retransmits == 3
+
+        columns = interval_columns(data["intervals"], direction="reverse")
+        assert columns["bytes"] == [1] * 13
+
+    def test_plan_cores(self, tmp_path, monkeypatch):
+        assert parse_cpulist("0-2,5,7-8\n") == [0, 1, 2, 5, 7, 8]
+
+        for node, cpulist in enumerate(["0-3", "4-7"]):
+            path = tmp_path / "devices" / "system" / "node" / "node{}".format(node)
+            path.mkdir(parents=True)
+            (path / "cpulist").write_text(cpulist)
+
+        device = tmp_path / "class" / "net" / "eth0" / "device"
+        (device / "msi_irqs" / "40").mkdir(parents=True)
+        (device / "numa_node").write_text("1")
+        irq = tmp_path / "irq" / "40"
+        irq.mkdir(parents=True)
+        (irq / "smp_affinity_list").write_text("4")
+
+        monkeypatch.setattr(
+            "iperf.iperf3.placement._usable_cpus", lambda: set(range(8))
+        )
+        cores = plan_cores(5, "eth0", sysfs=str(tmp_path), procfs=str(tmp_path))
+        assert cores == [5, 6, 7, 4, 0]
+        assert plan_cores(10, sysfs=str(tmp_path))[8:] == [0, 1]
+
+        with pytest.raises(ValueError):
+            ServerPool([5201, 5202], affinity=[0])
+
+    def test_server_pool_failures(self):
+        """Failing tests and callbacks don't kill the port's worker"""
+        pool = ServerPool([5201], callback=lambda result: 1 / 0)
+        pool.retry_delay = 0
+
+        class FailingServer(object):
+            runs = 0
+
+            def _run_json(self):
+                self.runs += 1
+                if self.runs == 3:
+                    pool._stopping.set()
+                raise OSError(22, "Invalid argument")
+
+        server = FailingServer()
+        pool._serve(server)
+        assert server.runs == 3
+        assert pool.results.qsize() == 2
+        assert "Invalid argument" in pool.results.get().error
+
+    def test_server_pool_stop_startup(self):
+        """A server not listening yet at the first wake-up is woken again"""
+
+        class SlowServer(object):
+            def __init__(self):
+                self.wakeups = 0
+                self.closed = False
+                self.woken = threading.Event()
+
+            def stop(self):
+                # The first wake-up arrives before the server is listening
+                self.wakeups += 1
+                if self.wakeups > 1:
+                    self.woken.set()
+
+            def close(self):
+                self.closed = True
+
+        server = SlowServer()
+        pool = ServerPool([5201])
+        pool._servers = [server]
+        pool._threads = [threading.Thread(target=server.woken.wait)]
+        pool._threads[0].start()
+
+        pool.stop()
+        assert server.wakeups == 2
+        assert server.closed
+
+        server = SlowServer()
+        server.stop = lambda: None
+        pool._servers = [server]
+        pool._threads = [threading.Thread(target=server.woken.wait)]
+        pool._threads[0].start()
+
+        pool.stop(timeout=0.3)
+        assert not server.closed
+        server.woken.set()
+
+    def test_server_run_failure(self):
+        """Errors of the server thread are raised by run"""
+        server = Server()
+        server.affinity = 1 << 20
+
+        with pytest.raises(OSError):
+            server.run()
+
+    def test_pacing_result(self, results_json):
+        data = json.loads(results_json)
+
+        result = TestResult(json.dumps(data))
+        assert result.target_bitrate is None
+        assert result.pacing_timer is None
+
+        data["start"]["test_start"].update(target_bitrate=10**8, fqrate=10**9)
+        result = TestResult(json.dumps(data))
+        assert result.target_bitrate == 10**8
+        assert result.fqrate == 10**9
+
+    def test_report_settings(self, results_json):
+        """Settings filled in by Client are part of the result text"""
+        result = TestResult(results_json)
+
+        class SimulatedClient(object):
+            reporter_interval = 0.5
+            fqrate = 10**9
+            burst = 10
+
+            @property
+            def pacing_timer(self):
+                raise NotImplementedError
+
+        assert Client._report_settings(SimulatedClient(), result)
+        assert result.reporter_interval == 0.5
+        assert result.pacing_timer is None
+
+        text = json.dumps(result.json)
+        for cls in (TestResult, CompactTestResult):
+            reported = cls(text)
+            assert reported.reporter_interval == 0.5
+            assert reported.fqrate == 10**9
+            assert reported.burst == 10
+
+    def test_convergence_policies(self):
+        def interval(bps, omitted=False):
+            return {"sum": {"bits_per_second": bps, "omitted": omitted}}
+
+        policy = CoefficientOfVariation(window=3, threshold=0.05)
+        assert policy.update(interval(1e6, omitted=True)) is None
+        assert policy.update(interval(5e8)) is None
+        assert policy.update(interval(1e9)) is None
+        assert policy.update(interval(1e9)) is None
+        assert policy.update(interval(1.01e9)).startswith("coefficient")
+
+        policy.reset()
+        assert policy.update(interval(1e9)) is None
+
+        policy = ConfidenceInterval(window=5, width=0.05)
+        for bps in (1e9, 1.2e9, 0.8e9, 1.1e9):
+            assert policy.update(interval(bps)) is None
+        assert policy.update(interval(0.9e9)) is None
+        for bps in (1e9, 1e9, 1.001e9, 1e9, 1e9):
+            reason = policy.update(interval(bps))
+        assert reason.startswith("95% confidence interval")
+
+    def test_client_convergence(self):
+        client = Client()
+        client.server_hostname = "127.0.0.1"
+        client.port = 5219
+        client.duration = 30
+        client.convergence = CoefficientOfVariation(window=3, threshold=0.5)
+
+        server = subprocess.Popen(["iperf3", "-s", "-p", "5219"])
+        sleep(0.3)  # give the server some time to start
+        result = client.run()
+        server.kill()
+
+        assert not result.error
+        assert client.duration == 30
+        assert client.num_bytes == 0
+        if not hasattr(client.lib, "iperf_set_test_json_stream"):
+            assert result.stop_reason is None
+            return
+
+        assert result.stop_reason
+        assert result.transfer_seconds < 30
+        assert TestResult(result.text).stop_reason == result.stop_reason
+
+    def test_converging_callback(self):
+        """The convergence callback never raises into the capture thread"""
+
+        class SimulatedClient(object):
+            def __init__(self, finish):
+                self._convergence = CoefficientOfVariation(window=2, threshold=0.5)
+                self.finish = finish
+
+        def unsupported():
+            raise NotImplementedError
+
+        for finish, ended in (
+            (lambda: True, True),
+            (lambda: False, False),
+            (unsupported, False),
+        ):
+            seen = []
+            stopped = []
+            callback = Client._converging(SimulatedClient(finish), seen.append, stopped)
+            for _ in range(4):
+                callback({"sum": {"bits_per_second": 1e9}})
+
+            assert len(seen) == 4
+            assert len(stopped) == (1 if ended else 0)
+
+    def test_metrics_exporter(self, results_json):
+        result = TestResult(results_json)
+
+        registry = MetricsRegistry(buckets=(1e8, 1e9))
+        registry.observe(result)
+        registry.observe(TestResult('{"error": "refused"}'), target="10.0.0.1:5201")
+        registry.interval_callback("10.0.0.2:5201")({"sum": {"bits_per_second": 5.0}})
+
+        with pytest.raises(ValueError):
+            registry.observe(TestResult('{"error": "refused"}'))
+
+        with MetricsServer(registry, port=0) as server:
+            url = "http://127.0.0.1:{}/metrics".format(server.port)
+            response = urllib.request.urlopen(url)
+            assert response.headers["Content-Type"].startswith(
+                "application/openmetrics-text"
+            )
+            text = response.read().decode("utf-8")
+
+        target = 'target="192.168.0.188:9987"'
+        assert "iperf3_sent_bits_per_second{%s} 935992000.0" % target in text
+        assert "iperf3_retransmits{%s} 0" % target in text
+        assert (
+            'iperf3_interval_bits_per_second_bucket{%s,le="+Inf"} 13' % target in text
+        )
+        assert 'iperf3_test_errors_total{target="10.0.0.1:5201"} 1' in text
+        assert 'iperf3_live_bits_per_second{target="10.0.0.2:5201"} 5.0' in text
+        assert text.endswith("# EOF\n")
+        assert registry.render() is registry.render()
+
+        registry.observe(TestResult('{"error": "refused"}'), target="10.0.0.2:5201")
+        assert b"iperf3_live_bits_per_second{" not in registry.render()